@@ -0,0 +1,249 @@
+"""
+Benchmarks of the engine hot paths.
+
+Each hot path is timed in isolation on representative boards, then
+whole simulated games and whole rendered frames (with the SDL dummy
+video driver) are timed. Each benchmark is run several times and its
+best run is kept, along with how far the other runs spread from it.
+Results are written as JSON; given a previous run with --baseline,
+the benchmarks that got slower than --tolerance plus their spread
+allows are reported and the exit status is 1.
+
+Usage: python bench.py [--output FILE] [--baseline FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+import numpy as np
+from board import Board
+from game import Game, TopReached, LEFT, RIGHT, HARD_DROP, ROTATE_LEFT
+from pieces import CELL_IDS
+
+# Runs of each benchmark; the best one is kept.
+REPEAT = 5
+
+def make_boards(seed=0):
+  """
+  Return the boards the hot paths are timed on, by name, as arrays
+  of cell ids. The top four rows are always left empty so pieces can
+  spawn.
+  """
+  rng = np.random.default_rng(seed)
+  height, width = 20, 10
+  boards = {"empty": np.zeros((height, width), dtype=np.int8)}
+
+  def stack(rows, fill):
+    cells = np.zeros((height, width), dtype=np.int8)
+    filled = rng.random((rows, width)) < fill
+    # Keep a gap in each row so it isn't complete.
+    filled[np.arange(rows), rng.integers(0, width, rows)] = False
+    cells[height - rows:] = np.where(filled, CELL_IDS["T"], 0)
+    return cells
+
+  boards["half_full"] = stack(height // 2, 0.8)
+  boards["near_top"] = stack(height - 4, 0.8)
+  # What partial line clears leave behind: scattered tiles and holes.
+  boards["fragmented"] = stack(height - 4, 0.45)
+  return boards
+
+def _time(statement, setup=None, repeat=REPEAT):
+  """
+  Return the times per call of statement, in seconds, of repeat runs.
+  """
+  timer = timeit.Timer(statement, setup or "pass")
+  number, _ = timer.autorange()
+  return [seconds / number for seconds in timer.repeat(repeat, number)]
+
+def _game_on(cells, seed=0):
+  game = Game(seed=seed)
+  game.board = Board.from_cells(cells)
+  return game
+
+def bench_hot_paths(boards):
+  results = {}
+  for name, cells in boards.items():
+    game = _game_on(cells)
+    block = game.current_block
+    board = game.board
+
+    def collide():
+      block.collide(block, game)
+    results[f"collide/{name}"] = _time(collide)
+
+    def drop_distance():
+      board.drop_distance(block.masks, block.orientation.bottoms,
+        block.x, block.y)
+    results[f"drop_distance/{name}"] = _time(drop_distance)
+
+    def hard_drop():
+      # Includes copying the board, see board_copy.
+      game.board = board.copy()
+      game._drop_distance = (None, 0)
+      block.y = 0
+      block.current = True
+      distance = game.drop_distance()
+      game.board.lock(block.struct, block.x, block.y + distance)
+      game.board.clear_lines()
+    results[f"hard_drop/{name}"] = _time(hard_drop)
+    game.board = board
+
+    results[f"board_copy/{name}"] = _time(board.copy)
+
+    def grid():
+      game.grid
+    results[f"grid/{name}"] = _time(grid)
+
+    # Four complete rows at the bottom, the rest of the board on top.
+    full = np.concatenate((cells[4:], np.full((4, cells.shape[1]), 1,
+      dtype=cells.dtype)))
+    cleared = Board.from_cells(full)
+    def line_clear():
+      cleared.copy().clear_lines()
+    results[f"line_clear/{name}"] = _time(line_clear)
+  return results
+
+def play_game(seed, max_pieces=500):
+  """
+  Play a game with a simple random policy and return the number of
+  blocks locked.
+  """
+  rng = random.Random(seed)
+  game = Game(seed=seed)
+  try:
+    while game.pieces_counter < max_pieces:
+      for _ in range(rng.randrange(3)):
+        game.apply(ROTATE_LEFT)
+      movement = rng.choice((LEFT, RIGHT))
+      for _ in range(rng.randrange(6)):
+        game.apply(movement)
+      game.update_current_block()
+      game.apply(HARD_DROP)
+  except TopReached:
+    pass
+  return game.pieces_counter
+
+def bench_games(games=20, repeat=REPEAT):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    pieces = sum(play_game(seed) for seed in range(games))
+    times.append((time.perf_counter() - start) / pieces)
+  return {"game/piece": times}
+
+def bench_frames(boards, frames=100, repeat=REPEAT):
+  os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  import pygame
+  from blockgroup import BlocksGroup
+  from renderer import Renderer, shadow_position, draw_shadow
+
+  pygame.display.init()
+  pygame.font.init()
+  screen = pygame.display.set_mode((700, 600))
+  font = pygame.font.Font(None, 20)
+  results = {}
+  for name, cells in boards.items():
+    blocks = BlocksGroup(seed=0)
+    blocks.game.board = Board.from_cells(cells)
+
+    def shadow():
+      blocks.game._drop_distance = (None, 0)
+      draw_shadow(blocks.current_block,
+        shadow_position(blocks.current_block, blocks), screen)
+    results[f"shadow/{name}"] = _time(shadow)
+
+    for dirty_rects in (False, True):
+      renderer = Renderer(screen, font, dirty_rects)
+      movements = (LEFT, RIGHT) * (frames // 2)
+      times = []
+      for _ in range(repeat):
+        start = time.perf_counter()
+        for movement in movements:
+          blocks.game.apply(movement)
+          renderer.render(blocks, 0, False, False)
+        times.append((time.perf_counter() - start) / len(movements))
+      mode = "dirty" if dirty_rects else "full"
+      results[f"frame_{mode}/{name}"] = times
+  pygame.quit()
+  return results
+
+def spread(times):
+  """
+  Return how much slower than the best of times the others got, as a
+  fraction of it.
+  """
+  return max(times) / min(times) - 1
+
+def compare(results, baseline, tolerance, spreads=None,
+    baseline_spreads=None):
+  """
+  Return the benchmarks slower than the baseline by more than
+  tolerance, as (name, baseline time, time). The spreads of a
+  benchmark in either run, when known, are added to the tolerance, so
+  the noisier benchmarks need a larger slowdown to be reported.
+  """
+  spreads = spreads or {}
+  baseline_spreads = baseline_spreads or {}
+  regressions = []
+  for name, seconds in sorted(results.items()):
+    if name not in baseline:
+      continue
+    allowed = tolerance + max(spreads.get(name, 0),
+      baseline_spreads.get(name, 0))
+    if seconds > baseline[name] * (1 + allowed):
+      regressions.append((name, baseline[name], seconds))
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the hot paths.")
+  parser.add_argument("--output", default="bench_output.txt",
+    help="JSON results file (default: bench_output.txt)")
+  parser.add_argument("--baseline",
+    help="results of a previous run to compare with")
+  parser.add_argument("--tolerance", type=float, default=0.25,
+    help="allowed slowdown over the baseline, on top of the spread of "
+      "the runs of each benchmark (default: 0.25)")
+  parser.add_argument("--no-render", action="store_true",
+    help="skip the benchmarks that need pygame")
+  args = parser.parse_args(argv)
+
+  boards = make_boards()
+  times = bench_hot_paths(boards)
+  times.update(bench_games())
+  if not args.no_render:
+    times.update(bench_frames(boards))
+  # The best run of each benchmark is the one compared, the others
+  # only tell how noisy it is.
+  results = {name: min(runs) for name, runs in times.items()}
+  spreads = {name: round(spread(runs), 4) for name, runs in times.items()}
+
+  for name, seconds in sorted(results.items()):
+    print(f"{name:28} {seconds * 1e6:12.2f} us")
+  report = {
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "machine": platform.machine(),
+    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "seconds": results,
+    "spreads": spreads,
+  }
+  with open(args.output, "w") as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline["seconds"], args.tolerance,
+      spreads, baseline.get("spreads"))
+    for name, before, after in regressions:
+      print(f"regression: {name} {before * 1e6:.2f} us -> {after * 1e6:.2f} us")
+    if regressions:
+      return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,5 +1,8 @@
+from functools import lru_cache
 import pygame
-import numpy as np
+from game import Piece, BottomReached, TopReached, SPAWN_X, SPAWN_Y
+from pieces import KINDS, CELL_IDS, GARBAGE_CELL, ORIENTATIONS
+from rendercache import RenderCache
 
 # Definir colores
 BLACK = (0, 0, 0)
@@ -15,67 +18,32 @@ ORANGE = (255, 165, 0)
 
 # Configuración de la pantalla
 SCREEN_WIDTH, SCREEN_HEIGHT = 700, 600
-GRID_WIDTH, GRID_HEIGHT = 300, 600
 TILE_SIZE = 30
-
-class BottomReached(Exception):
-  pass
-
-class TopReached(Exception):
-  pass
-
-class Block(pygame.sprite.Sprite):
-
-  @staticmethod
-  def collide(block, group):
-    """
-    Check if the specified block collides with some other block
-    in the group.
-    """
-    for other_block in group:
-      # Ignore the current block which will always collide with itself.
-      if block == other_block:
-        continue
-      if pygame.sprite.collide_mask(block, other_block) is not None:
-        return True
-    return False
-
-  def __init__(self):
-    super().__init__()
-    self.current = True
-    self.struct = np.array(self.struct)
-    self._draw()
-
-  def _draw(self, x=4, y=0):
-    width = len(self.struct[0]) * TILE_SIZE
-    height = len(self.struct) * TILE_SIZE
-    self.image = pygame.surface.Surface([width, height])
-    self.image.set_colorkey(BLACK)
-    # Position and size
-    self.rect = pygame.Rect(0, 0, width, height)
-    self.x = x
-    self.y = y
-    for y, row in enumerate(self.struct):
-      for x, col in enumerate(row):
-        if col:
-          pygame.draw.rect(
-						self.image,
-						self.color,
-						pygame.Rect(x*TILE_SIZE + 1, y*TILE_SIZE + 1,
-							TILE_SIZE - 2, TILE_SIZE - 2)
-					)
-    self._create_mask()
-
-  def redraw(self):
-    self._draw(self.x, self.y)
-
-  def _create_mask(self):
-    """
-		Create the mask attribute from the main surface.
-		The mask is required to check collisions. This should be called
-		after the surface is created or update.
-		"""
-    self.mask = pygame.mask.from_surface(self.image)
+# Width of the sidebar, right of the board.
+SIDEBAR_WIDTH = 400
+
+def screen_size(width=10, height=20):
+  """
+  Return the size of the screen for a board of width x height tiles.
+  """
+  return (width * TILE_SIZE + SIDEBAR_WIDTH,
+    max(height * TILE_SIZE, SCREEN_HEIGHT))
+
+class Block(Piece, pygame.sprite.Sprite):
+  """
+  Pygame view of a Piece, drawn with the shared surface of its kind
+  and orientation.
+  """
+
+  def _render(self):
+    return PIECE_IMAGES(self.kind, self.rotation)
+
+  def _draw(self, x=SPAWN_X, y=SPAWN_Y):
+    if not hasattr(self, "rect"):
+      self.rect = pygame.Rect(0, 0, 0, 0)
+    super()._draw(x, y)
+    self.image = self._render()
+    self.rect.size = self.image.get_size()
 
   def initial_draw(self):
     raise NotImplementedError
@@ -102,147 +70,94 @@ class Block(pygame.sprite.Sprite):
     self._y = value
     self.rect.top = value*TILE_SIZE
 
-  def move_left(self, group):
-    self.x -= 1
-    # Check if we reached the left margin.
-    if self.x < 0 or Block.collide(self, group):
-      self.x += 1
-
-  def move_right(self, group):
-    self.x += 1
-    # Check if we reached the right margin or collided with another
-    # block.
-    if self.rect.right > GRID_WIDTH or Block.collide(self, group):
-      # Rollback.
-      self.x -= 1
-
-  def move_down(self, group):
-    self.y += 1
-    # Check if the block reached the bottom or collided with
-    # another one.
-    if self.rect.bottom > GRID_HEIGHT or Block.collide(self, group):
-      # Rollback to the previous position.
-      self.y -= 1
-      self.current = False
-      raise BottomReached
-
-  def soft_drop(self, group):
-    self.y += 1
-    group.score += 1
-    # Check if the block reached the bottom or collided with
-    # another one.
-    if self.rect.bottom > GRID_HEIGHT or Block.collide(self, group):
-      # Rollback to the previous position.
-      self.y -= 1
-      group.score -= 1
-      self.current = False
-      raise BottomReached
-
-  def hard_drop(self, group):
-    while self.rect.bottom <= GRID_HEIGHT and not Block.collide(self, group):
-      self.y += 1
-      group.score += 2
-    # Once we reached the bottom or collided with another block,
-    self.y -= 1
-    group.score -= 2
-    self.current = False
-    raise BottomReached
-
-  def rotate_left(self, group):
-    self.image = pygame.transform.rotate(self.image, 90)
-    # Once rotated we need to update the size and position.
-    self.rect.width = self.image.get_width()
-    self.rect.height = self.image.get_height()
-    self._create_mask()
-    # Check the new position doesn't exceed the limits or collide
-    # with other blocks and adjust it if necessary.
-    while self.rect.right > GRID_WIDTH:
-      self.x -= 1
-    while self.rect.left < 0:
-      self.x += 1
-    while self.rect.bottom > GRID_HEIGHT:
-      self.y -= 1
-    while True:
-      if not Block.collide(self, group):
-        break
-      self.y -= 1
-    self.struct = np.rot90(self.struct)
-
-  def rotate_right(self, group):
-    self.image = pygame.transform.rotate(self.image, -90)
-    # Once rotated we need to update the size and position.
-    self.rect.width = self.image.get_width()
-    self.rect.height = self.image.get_height()
-    self._create_mask()
-    # Check the new position doesn't exceed the limits or collide
-    # with other blocks and adjust it if necessary.
-    while self.rect.right > GRID_WIDTH:
-      self.x -= 1
-    while self.rect.left < 0:
-      self.x += 1
-    while self.rect.bottom > GRID_HEIGHT:
-      self.y -= 1
-    while True:
-      if not Block.collide(self, group):
-        break
-      self.y -= 1
-    self.struct = np.rot90(self.struct,-1)
+  def _rotate(self, group, direction):
+    rotated = super()._rotate(group, direction)
+    if rotated:
+      self.image = self._render()
+      self.rect.size = self.image.get_size()
+    return rotated
 
   def update(self):
     if self.current:
       self.move_down()
 
 class OBlock(Block):
-  struct = (
-    (1, 1),
-    (1, 1)
-  )
+  kind = "O"
   color = YELLOW
 
 class TBlock(Block):
-  struct = (
-    (1, 1, 1),
-    (0, 1, 0)
-    )
+  kind = "T"
   color = MAGENTA
 
 class IBlock(Block):
-  struct = (
-    (1,),
-    (1,),
-    (1,),
-    (1,)
-  )
+  kind = "I"
   color = CYAN
 
 class LBlock(Block):
-  struct = (
-    (1, 1),
-    (1, 0),
-    (1, 0),
-  )
+  kind = "L"
   color = ORANGE
 
 class JBlock(Block):
-  struct = (
-    (1, 1),
-    (0, 1),
-    (0, 1),
-  )
+  kind = "J"
   color = BLUE
 
 class ZBlock(Block):
-  struct = (
-    (0, 1),
-    (1, 1),
-    (1, 0),
-  )
+  kind = "Z"
   color = RED
 
 class SBlock(Block):
-  struct = (
-    (1, 0),
-    (1, 1),
-    (0, 1),
-  )
+  kind = "S"
   color = GREEN
+
+BLOCK_TYPES = {block_type.kind: block_type
+  for block_type in Block.__subclasses__()}
+
+# Color of each cell id on the board.
+CELL_COLORS = {CELL_IDS[kind]: block_type.color
+  for kind, block_type in BLOCK_TYPES.items()}
+CELL_COLORS[GARBAGE_CELL] = GREY
+
+# Colors of the tiles: the blocks, the garbage and the shadow.
+TILE_COLORS = tuple(dict.fromkeys([*CELL_COLORS.values(), GREY]))
+
+@lru_cache(maxsize=None)
+def tile_atlas():
+  """
+  Return a surface with a tile of each of TILE_COLORS side by side,
+  and the area of each color in it. Tiles are drawn inside the grid
+  lines, so they are TILE_SIZE - 2 wide.
+  """
+  size = TILE_SIZE - 2
+  atlas = pygame.Surface((size * len(TILE_COLORS), size))
+  areas = {color: atlas.fill(color, (i * size, 0, size, size))
+    for i, color in enumerate(TILE_COLORS)}
+  return atlas, areas
+
+def draw_tiles(surface, tiles):
+  """
+  Draw tiles given as (column, row, color) on surface, blitting them
+  all from the atlas at once.
+  """
+  atlas, areas = tile_atlas()
+  surface.blits([
+    (atlas, (x*TILE_SIZE + 1, y*TILE_SIZE + 1), areas[color])
+    for x, y, color in tiles], False)
+
+def render_piece(kind, rotation):
+  """
+  Render a piece kind in the given orientation.
+  """
+  struct = ORIENTATIONS[kind][rotation].struct
+  image = pygame.surface.Surface(
+    [struct.shape[1] * TILE_SIZE, struct.shape[0] * TILE_SIZE])
+  image.set_colorkey(BLACK)
+  color = BLOCK_TYPES[kind].color
+  draw_tiles(image, ((x, y, color) for y, x in zip(*struct.nonzero())))
+  return image
+
+# Rendered surface of each kind and orientation, shared by every block
+# and by the previews.
+PIECE_IMAGES = RenderCache(render_piece, maxsize=len(KINDS) * 4)
+
+def create_block(kind):
+  return BLOCK_TYPES[kind]()
@@ -0,0 +1,239 @@
+from functools import lru_cache
+from itertools import count
+import numpy as np
+
+# Versions of the boards, unique among all of them.
+_versions = count()
+
+class Board:
+  """
+  Playfield stored as one integer bitmask per row, where bit i
+  is set when column i is occupied. A piece is described by the
+  bitmasks of its own rows, so checking a position only takes an
+  AND per piece row no matter how many blocks are locked.
+
+  The same tiles are kept in cells, a NumPy array holding the id
+  of the piece each tile belongs to (0 when empty), which is what
+  views work with. tops holds the row of the highest tile of each
+  column (height when it's empty).
+
+  Both are kept up to date as pieces lock rather than rebuilt, and a
+  row is complete when its bitmask is full_row, so locking a piece,
+  finding complete lines and drop distances don't scan the board:
+  they cost the same on a 40x200 board as on a 10x20 one.
+
+  cells is copied on write: copies and snapshots of a board share it,
+  marked read-only, until one of them locks a piece.
+
+  version changes every time the locked tiles change or are restored,
+  and is never the same for two different boards, so results computed
+  from the board can be cached by it.
+  """
+
+  @staticmethod
+  @lru_cache(maxsize=None)
+  def _row_masks(struct):
+    return tuple(
+      sum(1 << x for x, col in enumerate(row) if col) for row in struct)
+
+  @staticmethod
+  def row_masks(struct):
+    """
+    Return the row bitmasks of a piece struct. Results are cached,
+    so each orientation of a piece is only computed once.
+    """
+    return Board._row_masks(tuple(tuple(int(col) for col in row)
+      for row in struct))
+
+  def __init__(self, width=10, height=20):
+    self.width = width
+    self.height = height
+    self.full_row = (1 << width) - 1
+    self.clear()
+
+  @classmethod
+  def from_cells(cls, cells):
+    """
+    Build a board from an array of cell ids.
+    """
+    height, width = cells.shape
+    board = cls(width, height)
+    board.cells = np.array(cells, dtype=np.int8)
+    weights = 1 << np.arange(width, dtype=object)
+    filled = (board.cells != 0).astype(object)
+    board.rows = [int(row) for row in filled @ weights]
+    board.tops = board._tops(board.cells)
+    return board
+
+  def clear(self):
+    self.rows = [0] * self.height
+    self.cells = np.zeros((self.height, self.width), dtype=np.int8)
+    self.tops = [self.height] * self.width
+    self.version = next(_versions)
+
+  def copy(self):
+    board = Board.__new__(Board)
+    board.width = self.width
+    board.height = self.height
+    board.full_row = self.full_row
+    board.rows = self.rows.copy()
+    board.cells = self._share_cells()
+    board.tops = self.tops.copy()
+    board.version = self.version
+    return board
+
+  def _share_cells(self):
+    self.cells.flags.writeable = False
+    return self.cells
+
+  def snapshot(self):
+    """
+    Return the state of the board as an immutable (rows, cells, tops)
+    tuple, sharing its cells.
+    """
+    return tuple(self.rows), self._share_cells(), tuple(self.tops)
+
+  def restore(self, snapshot):
+    rows, self.cells, tops = snapshot
+    self.rows = list(rows)
+    self.tops = list(tops)
+    self.version = next(_versions)
+
+  def collides(self, masks, x, y):
+    """
+    Check if a piece with the given row masks placed at (x, y)
+    goes out of the playfield or overlaps a locked tile. Rows above
+    the top of the playfield are considered empty.
+    """
+    if x < 0 or y + len(masks) > self.height:
+      return True
+    rows = self.rows
+    for i, mask in enumerate(masks):
+      mask <<= x
+      if mask > self.full_row:
+        return True
+      if y + i >= 0 and rows[y + i] & mask:
+        return True
+    return False
+
+  def place(self, masks, x, y):
+    """
+    Lock a piece with the given row masks at (x, y).
+    """
+    for i, mask in enumerate(masks):
+      if y + i >= 0:
+        self.rows[y + i] |= mask << x
+
+  def remove(self, masks, x, y):
+    """
+    Remove a piece previously placed with the given row masks at (x, y).
+    """
+    for i, mask in enumerate(masks):
+      if y + i >= 0:
+        self.rows[y + i] &= ~(mask << x)
+
+  def lock(self, struct, x, y, cell=1):
+    """
+    Lock a piece struct at (x, y), tagging its tiles with cell.
+    Tiles above the top of the playfield are dropped.
+    """
+    self.place(Board.row_masks(struct), x, y)
+    self.version = next(_versions)
+    if not self.cells.flags.writeable:
+      self.cells = self.cells.copy()
+    struct = np.asarray(struct)[max(-y, 0):]
+    y = max(y, 0)
+    height, width = struct.shape
+    region = self.cells[y:y + height, x:x + width]
+    filled = struct != 0
+    region[filled] = cell
+    if not height:
+      return
+    tops = self.tops
+    for column, row in enumerate(filled.argmax(axis=0).tolist()):
+      if filled[row, column]:
+        tops[x + column] = min(tops[x + column], y + row)
+
+  def _tops(self, cells):
+    filled = cells != 0
+    return np.where(
+      filled.any(axis=0), filled.argmax(axis=0), self.height).tolist()
+
+  def clear_lines(self, candidates=None):
+    """
+    Remove the complete lines among the candidate rows (every row by
+    default) in one pass and drop the lines above them. Return the
+    indexes of the removed lines, from the top.
+    """
+    rows = self.rows
+    full_row = self.full_row
+    if candidates is None:
+      candidates = range(self.height)
+    cleared = [y for y in sorted(candidates)
+      if 0 <= y < self.height and rows[y] == full_row]
+    if not cleared:
+      return np.empty(0, dtype=int)
+    # Only the rows down to the lowest line cleared move.
+    bottom = cleared[-1] + 1
+    lines = len(cleared)
+    kept = [y for y in range(bottom) if rows[y] != full_row]
+    cells = self.cells
+    if not cells.flags.writeable:
+      cells = self.cells = cells.copy()
+    cells[lines:bottom] = cells[kept]
+    cells[:lines] = 0
+    rows[:bottom] = [0] * lines + [rows[y] for y in kept]
+    self.version = next(_versions)
+    # Tiles only move down, so each top is looked for from where it was.
+    tops = self.tops
+    for x, top in enumerate(tops):
+      if top < bottom:
+        bit = 1 << x
+        while top < self.height and not rows[top] & bit:
+          top += 1
+        tops[x] = top
+    return np.array(cleared)
+
+  def add_garbage(self, lines, hole, cell):
+    """
+    Push the board up lines rows and fill the rows freed at the
+    bottom with cell, except for the hole column. Return False when
+    tiles were pushed out of the top, which are lost. At most a board
+    height of lines is pushed.
+    """
+    lines = min(lines, self.height)
+    fits = not self.cells[:lines].any()
+    row = np.full(self.width, cell, dtype=self.cells.dtype)
+    row[hole] = 0
+    self.cells = np.concatenate((self.cells[lines:],
+      np.tile(row, (lines, 1))))
+    self.rows = self.rows[lines:] + [self.full_row & ~(1 << hole)] * lines
+    if fits:
+      self.tops = [top if x == hole and top == self.height else top - lines
+        for x, top in enumerate(self.tops)]
+    else:
+      self.tops = self._tops(self.cells)
+    self.version = next(_versions)
+    return fits
+
+  def drop_distance(self, masks, bottoms, x, y):
+    """
+    Return how many rows a piece with the given row masks and column
+    bottoms (see pieces.Orientation) can fall from (x, y).
+
+    When the piece is above the highest tile of every column it
+    covers, that only takes a lookup per column. Otherwise it is
+    tucked under an overhang and is moved down row by row.
+    """
+    # More than any column allows, even from above the board.
+    distance = self.height - y
+    for column, bottom in enumerate(bottoms):
+      row = y + bottom
+      top = self.tops[x + column]
+      if top <= row:
+        distance = 0
+        while not self.collides(masks, x, y + distance + 1):
+          distance += 1
+        return distance
+      distance = min(distance, top - row - 1)
+    return distance
@@ -0,0 +1,271 @@
+"""
+A bot choosing where to place each block.
+
+Every placement reachable by rotating the current block, moving it
+sideways and hard dropping it is simulated on the row bitmasks of the
+board (see board.Board) and the resulting board is scored with a
+weighted sum of standard features: aggregate height, holes, bumpiness
+and lines cleared. The search goes on through the next blocks and the
+held one with a beam: only the beam_width best boards of each step are
+expanded further.
+
+Boards are tracked by their Zobrist key (see zobrist.py), updated as
+each block locks. Orders of play reaching the same board with the
+same blocks left and held are transpositions: only the first one is
+kept. The scores of boards are kept in a transposition table from one
+search to the next, since the boards a search looks at ahead are the
+ones the next searches start from.
+"""
+import time
+from collections import namedtuple
+from game import (LEFT, RIGHT, HARD_DROP, ROTATE_LEFT, ROTATE_RIGHT, HOLD,
+  SPAWN_X, SPAWN_Y, spawn_x)
+from pieces import ORIENTATIONS, ROTATIONS
+from zobrist import Zobrist, TranspositionTable
+
+# Feature weights, from a genetic search over the same four features.
+Weights = namedtuple("Weights", "height lines holes bumpiness")
+WEIGHTS = Weights(height=-0.510066, lines=0.760666, holes=-0.35663,
+  bumpiness=-0.184483)
+
+# Quarter turns clockwise tried for each placement, with the actions
+# that do them.
+TURNS = ((0, ()), (1, (ROTATE_RIGHT,)), (2, (ROTATE_RIGHT, ROTATE_RIGHT)),
+  (-1, (ROTATE_LEFT,)))
+
+# A search state: the rows after the placements, their Zobrist key
+# and their number of tiles, the blocks left to place, the held kind,
+# the lines cleared and the actions of the first placement.
+Node = namedtuple("Node", "rows key tiles queue hold lines actions")
+
+def _collides(rows, masks, x, y, full_row):
+  # Board.collides over a bare list of rows.
+  if x < 0 or y + len(masks) > len(rows):
+    return True
+  for i, mask in enumerate(masks):
+    mask <<= x
+    if mask > full_row:
+      return True
+    if y + i >= 0 and rows[y + i] & mask:
+      return True
+  return False
+
+def _tops(rows, width):
+  # Row of the highest tile of each column, len(rows) when empty.
+  tops = [len(rows)] * width
+  covered = 0
+  for y, row in enumerate(rows):
+    new = row & ~covered
+    while new:
+      bit = new & -new
+      tops[bit.bit_length() - 1] = y
+      new ^= bit
+    covered |= row
+  return tops
+
+def _drop(rows, masks, bottoms, tops, x, y, full_row):
+  # Row where a block at (x, y) lands, as in Board.drop_distance.
+  landing = len(rows)
+  for column, bottom in enumerate(bottoms):
+    top = tops[x + column]
+    if top <= y + bottom:
+      while not _collides(rows, masks, x, y + 1, full_row):
+        y += 1
+      return y
+    landing = min(landing, top - bottom - 1)
+  return landing
+
+def _turn(rows, kind, rotation, x, y, turns, full_row):
+  """
+  Rotate a block turns quarters the way Piece._rotate does. Return
+  its new (rotation, x, y), or None when a rotation doesn't fit.
+  """
+  direction = 1 if turns > 0 else -1
+  for _ in range(abs(turns)):
+    rotation, kicks = ROTATIONS[kind][rotation][direction]
+    masks = ORIENTATIONS[kind][rotation].masks
+    for dx, dy in kicks:
+      if not _collides(rows, masks, x + dx, y + dy, full_row):
+        x += dx
+        y += dy
+        break
+    else:
+      return None
+  return rotation, x, y
+
+def placements(rows, kind, full_row, rotation=0, x=SPAWN_X, y=SPAWN_Y,
+    zobrist=None, key=0):
+  """
+  Yield (actions, rows, lines, key) for each placement of a block of
+  the given kind starting at (x, y) with the given rotation: the
+  actions that place it, the rows of the board afterwards, the number
+  of lines cleared and, given the Zobrist keys and the key of rows,
+  the key of the rows afterwards (None otherwise).
+  """
+  tops = _tops(rows, full_row.bit_length())
+  seen = set()
+  for turns, rotate in TURNS:
+    if kind == "O" and turns:
+      # The O block doesn't rotate.
+      break
+    turned = _turn(rows, kind, rotation, x, y, turns, full_row)
+    if turned is None:
+      continue
+    r, start_x, start_y = turned
+    masks = ORIENTATIONS[kind][r].masks
+    bottoms = ORIENTATIONS[kind][r].bottoms
+    for step, movement in ((-1, LEFT), (1, RIGHT)):
+      tx = start_x if step < 0 else start_x + 1
+      while not _collides(rows, masks, tx, start_y, full_row):
+        ty = _drop(rows, masks, bottoms, tops, tx, start_y, full_row)
+        spot = (masks, tx, ty)
+        if spot not in seen:
+          seen.add(spot)
+          moves = (movement,) * abs(tx - start_x)
+          placed = list(rows)
+          for i, mask in enumerate(masks):
+            if ty + i >= 0:
+              placed[ty + i] |= mask << tx
+          if zobrist:
+            placed_key = key ^ zobrist.piece_key(masks, tx, ty)
+          kept = [row for row in placed if row != full_row]
+          lines = len(rows) - len(kept)
+          if lines:
+            cleared = placed
+            placed = [0] * lines + kept
+            if zobrist:
+              # Only the rows down to the lowest line cleared moved.
+              bottom = max(y for y, row in enumerate(cleared)
+                if row == full_row) + 1
+              placed_key ^= (zobrist.board_key(cleared, bottom)
+                ^ zobrist.board_key(placed, bottom))
+          yield (rotate + moves + (HARD_DROP,), placed, lines,
+            placed_key if zobrist else None)
+        tx += step
+
+def features(rows, width, tiles=None):
+  """
+  Return (aggregate height, holes, bumpiness) of a board, tiles
+  being its number of tiles when known.
+  """
+  heights = [len(rows) - top for top in _tops(rows, width)]
+  if tiles is None:
+    tiles = sum(bin(row).count("1") for row in rows)
+  bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+  aggregate = sum(heights)
+  # Every cell under a column top is either a tile or a hole.
+  return aggregate, aggregate - tiles, bumpiness
+
+class Bot:
+  """
+  Chooses the actions placing the current block of a game.
+  depth is how many of the next blocks the search looks at, up to
+  the three of the queue.
+
+  The scores of boards are cached in table, a TranspositionTable of
+  table_size entries with the given replacement policy (no table when
+  table_size is 0). The depth of an entry is the step of the search
+  that scored it, so with the "depth" policy the boards furthest
+  ahead, which the next searches come back to, are kept.
+  """
+
+  def __init__(self, weights=WEIGHTS, beam_width=8, depth=3, use_hold=True,
+      table_size=1 << 16, policy="depth"):
+    self.weights = weights
+    self.beam_width = beam_width
+    self.depth = depth
+    self.use_hold = use_hold
+    self.table = None
+    if table_size:
+      self.table = TranspositionTable(table_size, policy)
+
+  def evaluate(self, rows, lines, width, tiles=None):
+    return self._board_score(rows, width, tiles) + self.weights.lines * lines
+
+  def _board_score(self, rows, width, tiles=None):
+    height, holes, bumpiness = features(rows, width, tiles)
+    w = self.weights
+    return w.height * height + w.holes * holes + w.bumpiness * bumpiness
+
+  def _score(self, node, width, step):
+    # evaluate, with the board part looked up in the table first.
+    table = self.table
+    score = None if table is None else table.get(node.key)
+    if score is None:
+      score = self._board_score(node.rows, width, node.tiles)
+      if table is not None:
+        table.put(node.key, score, step)
+    return score + self.weights.lines * node.lines
+
+  def _children(self, node, width, full_row, zobrist, seen, start=None,
+      can_hold=True):
+    """
+    Yield the nodes after placing the next block of node, or the held
+    one instead, skipping the states whose key is in seen and adding
+    the others. start is the (rotation, x, y) of the first block when
+    it isn't at its spawn position.
+    """
+    kind, queue = node.queue[0], node.queue[1:]
+    spawn = (0, spawn_x(width), SPAWN_Y)
+    options = [((), kind, queue, node.hold, start or spawn)]
+    if self.use_hold and can_hold:
+      if node.hold is not None:
+        options.append(((HOLD,), node.hold, queue, kind, spawn))
+      elif queue:
+        options.append(((HOLD,), queue[0], queue[1:], kind, spawn))
+    for prefix, kind, queue, hold, (rotation, x, y) in options:
+      if _collides(node.rows, ORIENTATIONS[kind][rotation].masks, x, y,
+          full_row):
+        continue
+      # The part of the state keys that is the same for every placement.
+      rest = zobrist.state_key(0, queue, hold)
+      for actions, rows, lines, key in placements(node.rows, kind, full_row,
+          rotation, x, y, zobrist, node.key):
+        if key ^ rest in seen:
+          continue
+        seen.add(key ^ rest)
+        yield Node(rows, key, node.tiles + 4 - lines * width, queue, hold,
+          node.lines + lines, node.actions or prefix + actions)
+
+  def plan(self, game, budget=None):
+    """
+    Return the actions placing the current block of game at the best
+    spot found, or an empty list when the game is lost anyway.
+
+    With budget, in seconds, the search stops looking further ahead
+    once that time is spent, and the best placement found so far is
+    taken.
+    """
+    deadline = budget and time.perf_counter() + budget
+    board = game.board
+    block = game.current_block
+    queue = (block.kind,) + tuple(b.kind for b in
+      (game.next_block, game.next_block2, game.next_block3)[:self.depth])
+    hold = game.holded_block.kind if game.holded_block else None
+    tiles = int(board.cells.astype(bool).sum())
+    zobrist = Zobrist.for_board(board.width, board.height)
+    beam = [Node(list(board.rows), zobrist.board_key(board.rows), tiles,
+      queue, hold, 0, ())]
+    best = None
+    step = 0
+    while beam:
+      children = []
+      # States of this step, by key.
+      seen = set()
+      for node in beam:
+        if deadline and best and time.perf_counter() > deadline:
+          return list(best.actions)
+        if not node.queue:
+          continue
+        children.extend(self._children(node, board.width, board.full_row,
+          zobrist, seen,
+          (block.rotation, block.x, block.y) if not step else None,
+          not (not step and game.hold_blocked)))
+      if not children:
+        break
+      step += 1
+      scored = sorted(children, reverse=True, key=lambda node:
+        self._score(node, board.width, step))
+      beam = scored[:self.beam_width]
+      best = beam[0]
+    return list(best.actions) if best else []
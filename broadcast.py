@@ -0,0 +1,59 @@
+"""
+Publish/subscribe stream of the states of a game, for spectators.
+
+A channel encodes each state published once, as the STATE message of
+protocol.py holding its delta from the previous one, and writes that
+same bytes object to every subscriber. Subscribers joining late are
+sent a keyframe of the latest state first, encoded once for all of
+them until the next state is published.
+"""
+from protocol import STATE, pack, encode_delta
+
+
+class Channel:
+  """
+  Stream of the states of one player's game. Subscribers are anything
+  with a write method taking bytes, such as an asyncio StreamWriter.
+  """
+
+  def __init__(self, player=0):
+    self.player = player
+    self.subscribers = set()
+    self.state = None
+    self.tick = 0
+    self._keyframe = None
+
+  def publish(self, state, tick=0):
+    """
+    Send the delta from the latest state to state to the subscribers.
+    Return the message sent, or None when nothing changed.
+    """
+    delta = encode_delta(self.state, state)
+    self.state = state
+    if not delta[0]:
+      return None
+    self.tick = tick
+    self._keyframe = None
+    message = pack(STATE, self.player, tick, payload=delta)
+    for subscriber in self.subscribers:
+      subscriber.write(message)
+    return message
+
+  def keyframe(self):
+    """
+    Return the STATE message holding the whole latest state, or None
+    before the first one.
+    """
+    if self._keyframe is None and self.state is not None:
+      self._keyframe = pack(STATE, self.player, self.tick,
+        payload=encode_delta(None, self.state))
+    return self._keyframe
+
+  def subscribe(self, subscriber):
+    keyframe = self.keyframe()
+    if keyframe is not None:
+      subscriber.write(keyframe)
+    self.subscribers.add(subscriber)
+
+  def unsubscribe(self, subscriber):
+    self.subscribers.discard(subscriber)
@@ -0,0 +1,230 @@
+"""
+Datasets of game positions and the actions taken from them, stored
+as fixed-width records in memory-mapped files.
+
+A dataset is a directory of shards, one per writer, so processes can
+record at once without sharing anything. A shard is made of:
+
+  NAME.bin   the records, back to back, in a file grown a chunk of
+             records at a time
+  NAME.json  the board size, the record dtype and how many records
+             of NAME.bin are written, replaced atomically on flush
+
+Each record holds the position before the action:
+
+  board        the tiles of the board, one bit per cell, row by row
+               from the top (np.packbits order)
+  current      cell id (see pieces.CELL_IDS) of the current block
+  next         cell ids of the next three blocks
+  hold         cell id of the held block, 0 when none
+  action       the action of game.py applied
+  score_delta  points the action scored
+  lines        lines it cleared
+
+Readers map the shards read-only: records are views over the files,
+only loaded as they are touched.
+"""
+import json
+import os
+import secrets
+from pathlib import Path
+import numpy as np
+from pieces import CELL_IDS
+
+VERSION = 1
+# Records the shard files grow by.
+CHUNK = 1 << 16
+
+def record_dtype(width=10, height=20):
+  """
+  Return the dtype of the records of a width x height board.
+  """
+  return np.dtype([
+    ("board", np.uint8, ((width * height + 7) // 8,)),
+    ("current", np.uint8),
+    ("next", np.uint8, (3,)),
+    ("hold", np.uint8),
+    ("action", np.uint8),
+    ("score_delta", "<i4"),
+    ("lines", np.uint8),
+  ])
+
+def boards(records, width=10, height=20):
+  """
+  Return the boards of records as booleans, shaped (..., height,
+  width).
+  """
+  bits = np.unpackbits(records["board"], axis=-1, count=width * height)
+  return bits.reshape(bits.shape[:-1] + (height, width)).astype(bool)
+
+def _cell_id(block):
+  return CELL_IDS[block.kind] if block else 0
+
+
+class DatasetWriter:
+  """
+  Appends the records of a shard of a dataset. name has to be unique
+  among the writers of a directory; it defaults to the process id and
+  a random token.
+  The file is preallocated chunk records at a time, and the records
+  written become visible to readers on flush and close.
+  """
+
+  def __init__(self, directory, name=None, width=10, height=20,
+      chunk=CHUNK):
+    self.directory = Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+    if name is None:
+      name = "%d-%s" % (os.getpid(), secrets.token_hex(4))
+    self.name = str(name)
+    self.width = width
+    self.height = height
+    self.dtype = record_dtype(width, height)
+    self.chunk = chunk
+    self.count = 0
+    self._path = self.directory / (self.name + ".bin")
+    # Fails when another writer has the same name.
+    self._file = open(self._path, "xb+")
+    self._records = None
+    self._grow()
+
+  def _grow(self):
+    capacity = (0 if self._records is None else len(self._records))
+    capacity += self.chunk
+    if self._records is not None:
+      self._records.flush()
+    self._file.truncate(capacity * self.dtype.itemsize)
+    self._records = np.memmap(self._file, self.dtype, "r+",
+      shape=(capacity,))
+    # Views of the fields, which are quicker to set one at a time than
+    # the fields of a record.
+    records = self._records.view(np.ndarray)
+    self._fields = {name: records[name] for name in self.dtype.names}
+
+  def append(self, game, action):
+    """
+    Apply an action to a game and append its record. Return what
+    game.apply does; TopReached is raised after the record is written.
+    """
+    if self.count == len(self._records):
+      self._grow()
+    i = self.count
+    fields = self._fields
+    fields["board"][i] = np.packbits(game.board.cells != 0)
+    fields["current"][i] = _cell_id(game.current_block)
+    fields["next"][i] = (_cell_id(game.next_block),
+      _cell_id(game.next_block2), _cell_id(game.next_block3))
+    fields["hold"][i] = _cell_id(game.holded_block)
+    fields["action"][i] = action
+    score = game.score
+    pieces = game.pieces_counter
+    self.count += 1
+    try:
+      return game.apply(action)
+    finally:
+      fields["score_delta"][i] = game.score - score
+      if game.pieces_counter != pieces:
+        fields["lines"][i] = len(game.cleared_rows)
+
+  def flush(self):
+    """
+    Write the records to the file and make them visible to readers.
+    """
+    self._records.flush()
+    meta = {
+      "version": VERSION,
+      "width": self.width,
+      "height": self.height,
+      "dtype": np.lib.format.dtype_to_descr(self.dtype),
+      "count": self.count,
+    }
+    path = self.directory / (self.name + ".json")
+    temporary = path.with_suffix(".json.tmp")
+    temporary.write_text(json.dumps(meta))
+    os.replace(temporary, path)
+
+  def close(self):
+    """
+    Flush, and give back the space preallocated and not used.
+    """
+    self.flush()
+    # Unmapped once no longer referenced.
+    self._records = self._fields = None
+    self._file.truncate(self.count * self.dtype.itemsize)
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+class Dataset:
+  """
+  Reads the shards of a dataset directory as a single sequence of
+  records. Indexing with an integer returns a record, and slicing
+  within a shard returns a view; both read from the mapped files
+  without copying. Slices and index arrays spanning several shards
+  are gathered into a new array. shards holds the record arrays of
+  the shards, for working on each of them in place.
+  """
+
+  def __init__(self, directory):
+    self.directory = Path(directory)
+    self.shards = []
+    self.width = self.height = None
+    for path in sorted(self.directory.glob("*.json")):
+      meta = json.loads(path.read_text())
+      if meta["version"] != VERSION:
+        raise ValueError("%s: unknown version %r" % (path, meta["version"]))
+      size = (meta["width"], meta["height"])
+      if self.width is None:
+        self.width, self.height = size
+      elif size != (self.width, self.height):
+        raise ValueError("%s: board size differs from the other shards"
+          % path)
+      if meta["count"]:
+        dtype = np.lib.format.descr_to_dtype(meta["dtype"])
+        self.shards.append(np.memmap(path.with_suffix(".bin"), dtype, "r",
+          shape=(meta["count"],)))
+    # Index of the first record of each shard, and the total.
+    self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+  def __len__(self):
+    return int(self.offsets[-1])
+
+  def _locate(self, index):
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError("record index out of range")
+    shard = int(np.searchsorted(self.offsets, index, "right")) - 1
+    return shard, index - int(self.offsets[shard])
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      start, stop, step = index.indices(len(self))
+      if step == 1 and start < stop:
+        shard, first = self._locate(start)
+        if stop <= self.offsets[shard + 1]:
+          return self.shards[shard][first:first + stop - start]
+      index = np.arange(start, stop, step)
+    if np.ndim(index):
+      index = np.asarray(index)
+      index = np.where(index < 0, index + len(self), index)
+      if len(index) and not (0 <= index.min() and index.max() < len(self)):
+        raise IndexError("record index out of range")
+      shards = np.searchsorted(self.offsets, index, "right") - 1
+      out = np.empty(len(index), self.shards[0].dtype if self.shards
+        else record_dtype())
+      for shard in np.unique(shards):
+        selected = shards == shard
+        out[selected] = self.shards[shard][
+          index[selected] - self.offsets[shard]]
+      return out
+    shard, offset = self._locate(int(index))
+    return self.shards[shard][offset]
+
+  def boards(self, records):
+    return boards(records, self.width, self.height)
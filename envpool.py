@@ -0,0 +1,232 @@
+"""
+Games spread over worker processes and stepped in lockstep through
+shared memory, for agents that need more games than one process can
+run.
+
+Each worker runs a VecEnv over its own slice of the games, whose
+arrays are views of one multiprocessing.shared_memory block: the pool
+writes the actions there and the workers write the observations,
+rewards and done flags in place. A step only sends each worker one
+byte and waits for one byte back, so nothing is pickled or copied.
+As in VecEnv, games that top out are reset right away.
+
+Usage: python envpool.py [--games N] [--workers N...] [--steps N]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from game import HOLD
+from vecenv import VecEnv
+
+def _fields(width, height):
+  # Arrays of the VecEnv state kept in shared memory, as (name, dtype,
+  # shape of one game).
+  return (
+    ("boards", np.int8, (height, width)),
+    ("kind", np.int8, ()),
+    ("rotation", np.int8, ()),
+    ("x", np.int32, ()),
+    ("y", np.int32, ()),
+    ("queue", np.int8, (3,)),
+    ("hold", np.int8, ()),
+    ("rewards", np.int64, ()),
+    ("dones", bool, ()),
+  )
+
+# Commands to the workers, and their answer.
+STEP, RESET, CLOSE, DONE = b"s", b"r", b"c", b"d"
+
+def _layout(num_games, width, height):
+  """
+  Return the (name, dtype, shape, offset) of each array in the shared
+  block, the actions included, and the size of the block.
+  """
+  layout = []
+  offset = 0
+  for name, dtype, shape in _fields(width, height) + (
+      ("actions", np.int8, ()),):
+    shape = (num_games,) + shape
+    layout.append((name, dtype, shape, offset))
+    size = np.dtype(dtype).itemsize * int(np.prod(shape))
+    # Keep every array 8 bytes aligned.
+    offset += -(-size // 8) * 8
+  return layout, max(offset, 1)
+
+def _arrays(buffer, layout):
+  return {name: np.ndarray(shape, dtype, buffer, offset)
+    for name, dtype, shape, offset in layout}
+
+def _worker(conn, memory, layout, start, stop, width, height, gravity, seed):
+  arrays = _arrays(memory.buf, layout)
+  env = VecEnv(stop - start, width, height, gravity, seed)
+  # The state of env moves to shared memory; VecEnv only updates its
+  # arrays in place.
+  for name, _, _ in _fields(width, height):
+    view = arrays[name][start:stop]
+    view[...] = getattr(env, name)
+    setattr(env, name, view)
+  actions = arrays["actions"][start:stop]
+  conn.send_bytes(DONE)
+  try:
+    while True:
+      command = conn.recv_bytes()
+      if command == STEP:
+        env.step(actions)
+      elif command == RESET:
+        env.reset()
+      else:
+        break
+      conn.send_bytes(DONE)
+  except (EOFError, KeyboardInterrupt):
+    # The pool is gone.
+    pass
+
+
+class EnvPool:
+  """
+  num_games games stepped in lockstep by workers processes (one per
+  core by default), each one running a VecEnv over a slice of them.
+  The interface is VecEnv's: step takes one action of game.py per
+  game and returns (observation, rewards, dones). The arrays returned
+  are views of the shared memory, valid until the next step, and
+  must be let go before close.
+  """
+
+  def __init__(self, num_games, workers=None, width=10, height=20,
+      gravity=10, seed=None):
+    self.num_games = num_games
+    self.width = width
+    self.height = height
+    workers = max(1, min(workers or os.cpu_count(), num_games))
+    layout, size = _layout(num_games, width, height)
+    self._memory = SharedMemory(create=True, size=size)
+    self._arrays = _arrays(self._memory.buf, layout)
+    self.rewards = self._arrays["rewards"]
+    self.dones = self._arrays["dones"]
+    bounds = np.linspace(0, num_games, workers + 1).astype(int).tolist()
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    self._connections = []
+    self._processes = []
+    for i in range(workers):
+      parent, child = multiprocessing.Pipe()
+      process = multiprocessing.Process(target=_worker, daemon=True,
+        args=(child, self._memory, layout, bounds[i], bounds[i + 1], width,
+          height, gravity, seeds[i]))
+      process.start()
+      child.close()
+      self._connections.append(parent)
+      self._processes.append(process)
+    self._wait()
+
+  @property
+  def workers(self):
+    return len(self._processes)
+
+  def _wait(self):
+    for connection in self._connections:
+      if connection.recv_bytes() != DONE:
+        raise RuntimeError("unexpected answer from a worker")
+
+  def _command(self, command):
+    for connection in self._connections:
+      connection.send_bytes(command)
+    self._wait()
+
+  def observe(self):
+    """
+    Return the observation arrays, as VecEnv.observe does.
+    """
+    arrays = self._arrays
+    return {
+      "board": arrays["boards"],
+      "kind": arrays["kind"],
+      "rotation": arrays["rotation"],
+      "x": arrays["x"],
+      "y": arrays["y"],
+      "queue": arrays["queue"],
+      "hold": arrays["hold"],
+    }
+
+  def reset(self):
+    self._command(RESET)
+    return self.observe()
+
+  def step(self, actions):
+    """
+    Apply one action per game. Return (observation, rewards, dones),
+    rewards being the score gained in the step.
+    """
+    self._arrays["actions"][:] = actions
+    self._command(STEP)
+    return self.observe(), self.rewards, self.dones
+
+  def close(self):
+    if self._memory is None:
+      return
+    for connection in self._connections:
+      try:
+        connection.send_bytes(CLOSE)
+      except OSError:
+        pass
+      connection.close()
+    for process in self._processes:
+      process.join()
+    self._arrays = self.rewards = self.dones = None
+    try:
+      self._memory.close()
+    except BufferError:
+      # Observations are still referenced; the block is unmapped when
+      # they are let go.
+      pass
+    self._memory.unlink()
+    self._memory = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def steps_per_second(env, steps, seed=0):
+  """
+  Step env with random actions and return how many game steps per
+  second it ran.
+  """
+  rng = np.random.default_rng(seed)
+  actions = rng.integers(0, HOLD + 1, (steps, env.num_games), dtype=np.int8)
+  start = time.perf_counter()
+  for step_actions in actions:
+    env.step(step_actions)
+  return env.num_games * steps / (time.perf_counter() - start)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Measure the steps per second of the environment pool.")
+  parser.add_argument("--games", type=int, default=1024)
+  parser.add_argument("--workers", type=int, nargs="+",
+    default=[1, os.cpu_count()], help="worker counts to measure "
+      "(default: 1 and one per core)")
+  parser.add_argument("--steps", type=int, default=500,
+    help="steps of every game (default: 500)")
+  args = parser.parse_args(argv)
+
+  results = {
+    "cores": os.cpu_count(),
+    "games": args.games,
+    "vecenv": round(steps_per_second(VecEnv(args.games, seed=0), args.steps)),
+  }
+  for workers in dict.fromkeys(args.workers):
+    with EnvPool(args.games, workers, seed=0) as pool:
+      results["pool_%d" % pool.workers] = round(
+        steps_per_second(pool, args.steps))
+  print(json.dumps(results, indent=2))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,466 @@
+import random
+from collections import namedtuple
+import numpy as np
+from board import Board
+from pieces import KINDS, CELL_IDS, GARBAGE_CELL, ORIENTATIONS, ROTATIONS
+
+# Movements of the current block.
+LEFT, RIGHT, SOFT_DROP, HARD_DROP = range(4)
+# Other actions, numbered after the movements.
+ROTATE_LEFT, ROTATE_RIGHT, HOLD = range(4, 7)
+
+# Points per level for 0 to 4 lines cleared at once, and when those
+# lines leave the board empty.
+LINE_SCORES = (0, 100, 300, 500, 800)
+PERFECT_CLEAR_SCORES = (0, 800, 1200, 1800, 2000)
+# Points per level and per combo step.
+COMBO_SCORE = 50
+# Lines needed to reach the next level.
+LINES_PER_LEVEL = 10
+
+# Spawn position of new blocks on the standard 10 columns wide board.
+SPAWN_X, SPAWN_Y = 4, 0
+
+def spawn_x(width):
+  """
+  Return the spawn column of new blocks on a board of the given width.
+  """
+  return width // 2 - 1
+
+# Immutable state of a Game, see Game.snapshot. Blocks are stored by
+# kind, the current one as (kind, rotation, x, y).
+GameState = namedtuple("GameState", "board current queue hold hold_blocked "
+  "bag random score level lines_counter combo_counter pieces_counter ticks "
+  "cleared_rows inputs")
+
+class BottomReached(Exception):
+  pass
+
+class TopReached(Exception):
+  pass
+
+class Piece:
+  """
+  A tetromino without any rendering attached. Views subclass it
+  to draw the piece.
+  """
+
+  kind = None
+
+  @staticmethod
+  def collide(piece, game):
+    """
+    Check if the specified piece goes out of the board or collides
+    with a locked block.
+    """
+    return game.board.collides(piece.masks, piece.x, piece.y)
+
+  def __init__(self, kind=None):
+    super().__init__()
+    if kind is not None:
+      self.kind = kind
+    self.reset()
+
+  def reset(self, x=SPAWN_X):
+    """
+    Put the piece back in its spawn orientation and position, x
+    being the spawn column.
+    """
+    self.current = True
+    self.rotation = 0
+    self._draw(x)
+
+  def _draw(self, x=SPAWN_X, y=SPAWN_Y):
+    self.x = x
+    self.y = y
+    self.orientation = ORIENTATIONS[self.kind][self.rotation]
+
+  @property
+  def struct(self):
+    return self.orientation.struct
+
+  @property
+  def masks(self):
+    return self.orientation.masks
+
+  def redraw(self):
+    self._draw(self.x, self.y)
+
+  @property
+  def width(self):
+    return self.struct.shape[1]
+
+  @property
+  def height(self):
+    return self.struct.shape[0]
+
+  def move_left(self, game):
+    self.x -= 1
+    # Check if we reached the left margin or collided with another
+    # block.
+    if Piece.collide(self, game):
+      self.x += 1
+
+  def move_right(self, game):
+    self.x += 1
+    # Check if we reached the right margin or collided with another
+    # block.
+    if Piece.collide(self, game):
+      # Rollback.
+      self.x -= 1
+
+  def move_down(self, game):
+    self.y += 1
+    # Check if the block reached the bottom or collided with
+    # another one.
+    if Piece.collide(self, game):
+      # Rollback to the previous position.
+      self.y -= 1
+      self.current = False
+      raise BottomReached
+
+  def soft_drop(self, game):
+    self.y += 1
+    game.score += 1
+    # Check if the block reached the bottom or collided with
+    # another one.
+    if Piece.collide(self, game):
+      # Rollback to the previous position.
+      self.y -= 1
+      game.score -= 1
+      self.current = False
+      raise BottomReached
+
+  def hard_drop(self, game):
+    distance = game.drop_distance()
+    self.y += distance
+    game.score += 2 * distance
+    self.current = False
+    raise BottomReached
+
+  def _rotate(self, game, direction):
+    """
+    Rotate clockwise (1) or counter-clockwise (-1), trying each kick
+    of the rotation table until one fits. Return False when none of
+    them does and the piece stays as it was.
+    """
+    rotation, kicks = ROTATIONS[self.kind][self.rotation][direction]
+    orientation = ORIENTATIONS[self.kind][rotation]
+    for dx, dy in kicks:
+      if not game.board.collides(orientation.masks, self.x + dx, self.y + dy):
+        self.rotation = rotation
+        self.orientation = orientation
+        self.x += dx
+        self.y += dy
+        return True
+    return False
+
+  def rotate_left(self, game):
+    return self._rotate(game, -1)
+
+  def rotate_right(self, game):
+    return self._rotate(game, 1)
+
+
+class Game:
+  """
+  Game rules without any rendering: the random bag, the next
+  blocks queue, hold, scoring, combos and levels. Pieces are built
+  through piece_factory, so a view can provide its own subclass
+  of Piece. Pieces that leave the game (locked, or replaced in the
+  hold) are kept in a pool and reset to be used again, so a long
+  game doesn't keep building new ones.
+
+  The bag is shuffled with a generator of its own seeded with seed
+  (a random one when not given), so a game is reproduced by its seed
+  and its inputs. With record, every action given to apply is logged
+  in inputs as (ticks, action), ticks being the gravity steps done
+  so far.
+
+  The board is width columns by height rows. Moves and locks cost the
+  same on any board size, see Board.
+  """
+
+  def get_random_block(self):
+    if self.random_bag == []:
+      self.random_bag = list(KINDS)
+      self.random.shuffle(self.random_bag)
+      self._random_state = None
+    return self._new_piece(self.random_bag.pop())
+
+  def _new_piece(self, kind):
+    pool = self._pool[kind]
+    if pool:
+      piece = pool.pop()
+    else:
+      piece = self.piece_factory(kind)
+      if self.spawn_x == SPAWN_X:
+        return piece
+    piece.reset(self.spawn_x)
+    return piece
+
+  def _free_piece(self, piece):
+    self._pool[piece.kind].append(piece)
+
+  def __init__(self, piece_factory=Piece, seed=None, record=False,
+      width=10, height=20):
+    self.piece_factory = piece_factory
+    # Pieces no longer in the game, by kind.
+    self._pool = {kind: [] for kind in KINDS}
+    if seed is None:
+      seed = random.getrandbits(64)
+    self.seed = seed
+    self.random = random.Random(seed)
+    # State of random, kept for snapshots until it's used again.
+    self._random_state = None
+    self.ticks = 0
+    self.inputs = [] if record else None
+    self.board = Board(width, height)
+    self.spawn_x = spawn_x(width)
+    self.current_block = None
+    self.cleared_rows = np.empty(0, dtype=int)
+    self.score = 0
+    self.level = 1
+    self.lines_counter = 0
+    self.combo_counter = 0
+    # Blocks locked so far.
+    self.pieces_counter = 0
+    self._drop_distance = (None, 0)
+    self.next_block = None
+    self.next_block2 = None
+    self.next_block3 = None
+    self.holded_block = None
+    self.hold_blocked = False
+    self.random_bag = []
+    # The first block.
+    self._create_new_block()
+
+  def _check_line_completion(self):
+    """
+    Remove the complete lines and return how many of them
+    were removed. Only the rows of the block just locked can be
+    complete, so only those are checked.
+    """
+    block = self.current_block
+    self.cleared_rows = self.board.clear_lines(
+      range(block.y, block.y + block.height))
+    return len(self.cleared_rows)
+
+  def update_score(self, lines_completed):
+    if not self.board.rows[-1]:
+      self.score += PERFECT_CLEAR_SCORES[lines_completed] * self.level
+    else:
+      self.score += LINE_SCORES[lines_completed] * self.level
+
+    if self.combo_counter > 0:
+      self.score += COMBO_SCORE * self.combo_counter * self.level
+
+  def _create_new_block(self, not_holded=True, block_kind=None):
+    if not_holded:
+      new_block = self.next_block or self.get_random_block()
+      self.next_block = self.next_block2 or self.get_random_block()
+      self.next_block2 = self.next_block3 or self.get_random_block()
+      if Piece.collide(new_block, self):
+        raise TopReached
+      self.current_block = new_block
+      self.next_block3 = self.get_random_block()
+    else:
+      new_block = self._new_piece(block_kind)
+      if Piece.collide(new_block, self):
+        raise TopReached
+      self.current_block = new_block
+
+    self.hold_blocked = False
+
+  @property
+  def grid(self):
+    """
+    The locked tiles with the current block laid over them. It is
+    only built when asked for: the board changes when a block locks
+    or lines are cleared, and moving the current block only changes
+    its position.
+    """
+    grid = self.board.cells.copy()
+    block = self.current_block
+    struct = block.struct[max(-block.y, 0):]
+    y = max(block.y, 0)
+    region = grid[y:y + len(struct), block.x:block.x + block.width]
+    region[struct != 0] = CELL_IDS[block.kind]
+    return grid
+
+  def drop_distance(self):
+    """
+    Return how many rows the current block can fall. The result is
+    cached until the block moves or rotates, or the board changes.
+    """
+    block = self.current_block
+    key = (self.board.version, block, block.rotation, block.x, block.y)
+    if self._drop_distance[0] != key:
+      self._drop_distance = (key, self.board.drop_distance(
+        block.orientation.masks, block.orientation.bottoms,
+        block.x, block.y))
+    return self._drop_distance[1]
+
+  def _lock_current_block(self):
+    block = self.current_block
+    self.board.lock(block.struct, block.x, block.y, CELL_IDS[block.kind])
+    self.pieces_counter += 1
+    lines_completed = self._check_line_completion()
+
+    if lines_completed:
+      self.update_score(lines_completed)
+      self.lines_counter += lines_completed
+      if self.lines_counter >= LINES_PER_LEVEL:
+        self.level += 1
+        self.lines_counter -= LINES_PER_LEVEL
+      self.combo_counter += 1
+
+    elif self.combo_counter > 0:
+      self.combo_counter = 0
+
+    self._create_new_block()
+    self._free_piece(block)
+
+  def update_current_block(self):
+    """
+    Move the current block one row down. Return True when it
+    was locked and a new block was created.
+    """
+    self.ticks += 1
+    try:
+      self.current_block.move_down(self)
+    except BottomReached:
+      self._lock_current_block()
+      return True
+    return False
+
+  def move_current_block(self, movement):
+    """
+    Apply one of LEFT, RIGHT, SOFT_DROP or HARD_DROP to the
+    current block. Return True when it was locked and a new block
+    was created.
+    """
+    block = self.current_block
+    action = {
+      SOFT_DROP: block.soft_drop,
+      LEFT: block.move_left,
+      RIGHT: block.move_right,
+      HARD_DROP: block.hard_drop
+    }
+    try:
+      action[movement](self)
+    except BottomReached:
+      self._lock_current_block()
+      return True
+    return False
+
+  def rotate_current_block_left(self):
+    # Prevent SquareBlocks rotation.
+    if self.current_block.kind != "O":
+      self.current_block.rotate_left(self)
+
+  def rotate_current_block_right(self):
+    # Prevent SquareBlocks rotation.
+    if self.current_block.kind != "O":
+      self.current_block.rotate_right(self)
+
+  def hold_current_block(self):
+    block = self.current_block
+    previous = self.holded_block
+    self.holded_block = block
+    if previous:
+      self._free_piece(previous)
+      self._create_new_block(not_holded=False, block_kind=previous.kind)
+
+    else:
+      self._create_new_block()
+
+    block.reset(self.spawn_x)
+    self.hold_blocked = True
+
+  def add_garbage(self, lines, hole):
+    """
+    Push lines garbage lines, with a hole in the given column, under
+    the locked tiles. Raise TopReached when tiles are pushed out of the
+    board or the current block doesn't fit any more.
+    """
+    fits = self.board.add_garbage(lines, hole, GARBAGE_CELL)
+    if not fits or Piece.collide(self.current_block, self):
+      raise TopReached
+
+  def snapshot(self):
+    """
+    Return the state of the game as a GameState. Snapshots are
+    immutable and share the locked tiles with the game (see Board), so
+    many of them can be taken and restored, in any order, for search
+    or undo.
+    """
+    block = self.current_block
+    return GameState(
+      self.board.snapshot(),
+      (block.kind, block.rotation, block.x, block.y),
+      tuple(b.kind for b in (self.next_block, self.next_block2,
+        self.next_block3)),
+      self.holded_block.kind if self.holded_block else None,
+      self.hold_blocked,
+      tuple(self.random_bag),
+      self._get_random_state(),
+      self.score, self.level, self.lines_counter, self.combo_counter,
+      self.pieces_counter, self.ticks, self.cleared_rows,
+      None if self.inputs is None else len(self.inputs))
+
+  def _get_random_state(self):
+    if self._random_state is None:
+      self._random_state = self.random.getstate()
+    return self._random_state
+
+  def restore(self, state):
+    """
+    Bring the game back to a state returned by snapshot. The recorded
+    inputs are cut back to the snapshot, so restoring a snapshot taken
+    on another line of play makes them meaningless.
+    """
+    self.board.restore(state.board)
+    # After a top out in a hold, the current block is also the held one.
+    for piece in {self.current_block, self.next_block, self.next_block2,
+        self.next_block3, self.holded_block} - {None}:
+      self._free_piece(piece)
+    kind, rotation, x, y = state.current
+    self.current_block = self._new_piece(kind)
+    self.current_block.rotation = rotation
+    self.current_block._draw(x, y)
+    self.next_block, self.next_block2, self.next_block3 = (
+      self._new_piece(kind) for kind in state.queue)
+    self.holded_block = state.hold and self._new_piece(state.hold)
+    self.hold_blocked = state.hold_blocked
+    self.random_bag = list(state.bag)
+    if state.random is not self._random_state:
+      self.random.setstate(state.random)
+      self._random_state = state.random
+    self.score = state.score
+    self.level = state.level
+    self.lines_counter = state.lines_counter
+    self.combo_counter = state.combo_counter
+    self.pieces_counter = state.pieces_counter
+    self.ticks = state.ticks
+    self.cleared_rows = state.cleared_rows
+    if state.inputs is not None and self.inputs is not None:
+      del self.inputs[state.inputs:]
+
+  def apply(self, action):
+    """
+    Apply one of the actions of this module to the current block.
+    Return True when it was locked and a new block was created.
+    """
+    if self.inputs is not None:
+      self.inputs.append((self.ticks, action))
+    if action == ROTATE_LEFT:
+      self.rotate_current_block_left()
+    elif action == ROTATE_RIGHT:
+      self.rotate_current_block_right()
+    elif action == HOLD:
+      if not self.hold_blocked:
+        self.hold_current_block()
+    else:
+      return self.move_current_block(action)
+    return False
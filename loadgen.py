@@ -0,0 +1,231 @@
+"""
+Loopback client of the match server, and a load generator built on it.
+
+The load generator starts a server in a subprocess, unless --port is
+given, and keeps --matches matches running with random players for
+--duration seconds. Players rejoin a new match when theirs is over.
+It then reports the latencies from each input to its acknowledgement
+and how many matches one core of the server can run. With
+--spectators, that many clients also watch the latest match.
+
+Usage: python loadgen.py [--matches N] [--players N] [--duration S]
+                         [--spectators N]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from game import LEFT, RIGHT, SOFT_DROP, HARD_DROP, ROTATE_LEFT, \
+  ROTATE_RIGHT, HOLD
+from protocol import (JOIN, WATCH, INPUT, START, STATE, OVER, NO_PLAYER,
+  pack, read_message, PlayerView)
+
+# Actions of the random players, the hard drops being rarer.
+ACTIONS = (LEFT, RIGHT, SOFT_DROP, ROTATE_LEFT, ROTATE_RIGHT, HOLD) * 3 + (
+  HARD_DROP,)
+
+
+class Client:
+  """
+  Player or spectator connected to the server. The games of the match
+  are mirrored in views, one PlayerView per player, from the STATE
+  messages, and places holds the place of each player out of it.
+  latencies holds the seconds from each input to the first STATE
+  message acknowledging it.
+  """
+
+  def __init__(self):
+    self.reader = self.writer = None
+    self.index = None
+    self.views = []
+    self.places = {}
+    self.received = 0
+    self.tick = 0
+    self.latencies = []
+    self._sent = {}
+
+  async def connect(self, host, port):
+    self.reader, self.writer = await asyncio.open_connection(host, port)
+
+  async def join(self, players):
+    """
+    Ask for a match and wait for it to start.
+    """
+    self.writer.write(pack(JOIN, players))
+    await self._started()
+
+  async def watch(self, match_id=0):
+    """
+    Spectate a match, the latest one by default.
+    """
+    self.writer.write(pack(WATCH, match_id))
+    await self._started()
+
+  async def _started(self):
+    while True:
+      message = await read_message(self.reader)
+      if message is None:
+        raise ConnectionError("server closed the connection")
+      kind, fields, _ = message
+      if kind == START:
+        _, self.index, players, _ = fields
+        self.views = [PlayerView() for _ in range(players)]
+        self.places = {}
+        return
+
+  @property
+  def over(self):
+    """
+    Whether the player is out of the match, or the match is over for
+    a spectator.
+    """
+    if self.index == NO_PLAYER:
+      return len(self.places) == len(self.views)
+    return self.index in self.places
+
+  def send(self, action):
+    self.tick += 1
+    self._sent[self.tick] = time.perf_counter()
+    self.writer.write(pack(INPUT, self.tick, action))
+
+  def _handle(self, kind, fields, payload):
+    if kind == STATE:
+      player, tick = fields
+      self.views[player].apply(payload)
+      sent = self._sent.pop(tick, None) if player == self.index else None
+      if sent is not None:
+        self.latencies.append(time.perf_counter() - sent)
+    elif kind == OVER:
+      player, place = fields
+      self.places[player] = place
+
+  async def receive(self):
+    """
+    Handle the messages of the server until the match is over for
+    this client.
+    """
+    while not self.over:
+      message = await read_message(self.reader)
+      if message is None:
+        raise ConnectionError("server closed the connection")
+      self.received += 1
+      self._handle(*message)
+
+  def close(self):
+    self.writer.close()
+
+
+async def random_player(host, port, players, until, inputs_per_second, rng,
+    results):
+  """
+  Play random matches until the given time.
+  """
+  while time.perf_counter() < until:
+    client = Client()
+    await client.connect(host, port)
+    try:
+      await client.join(players)
+      receiving = asyncio.ensure_future(client.receive())
+      while not receiving.done() and time.perf_counter() < until:
+        client.send(rng.choice(ACTIONS))
+        await asyncio.sleep(rng.expovariate(inputs_per_second))
+      receiving.cancel()
+      results["matches"] += 1
+    except ConnectionError:
+      pass
+    finally:
+      results["latencies"] += client.latencies
+      client.close()
+
+async def spectator(host, port, until, results):
+  """
+  Watch the latest match, then the next one, until the given time.
+  """
+  while time.perf_counter() < until:
+    client = Client()
+    await client.connect(host, port)
+    try:
+      await client.watch()
+      await asyncio.wait_for(client.receive(), until - time.perf_counter())
+    except (ConnectionError, asyncio.TimeoutError):
+      # No match to watch yet, or time is up.
+      await asyncio.sleep(0.1)
+    finally:
+      results["spectated"] += client.received
+      client.close()
+
+async def start_server():
+  """
+  Start a server on a free port in a subprocess. Return it and its port.
+  """
+  process = await asyncio.create_subprocess_exec(
+    sys.executable, str(Path(__file__).with_name("server.py")), "--port", "0",
+    stdout=asyncio.subprocess.PIPE)
+  line = (await process.stdout.readline()).decode()
+  return process, int(line.rsplit(":", 1)[1])
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+async def run(args):
+  process = None
+  port = args.port
+  if port is None:
+    process, port = await start_server()
+  rng = random.Random(args.seed)
+  results = {"matches": 0, "latencies": [], "spectated": 0}
+  start = time.perf_counter()
+  until = start + args.duration
+  await asyncio.gather(*(
+    random_player(args.host, port, args.players, until,
+      args.inputs_per_second, random.Random(rng.getrandbits(64)), results)
+    for _ in range(args.matches * args.players)), *(
+    spectator(args.host, port, until, results)
+    for _ in range(args.spectators)))
+  elapsed = time.perf_counter() - start
+  latencies = results["latencies"]
+  report = {
+    "matches": results["matches"] // args.players,
+    "inputs": len(latencies),
+    "seconds": round(elapsed, 3),
+    "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+    "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    "spectator_messages": results["spectated"],
+  }
+  if process:
+    process.terminate()
+    stats = json.loads((await process.stdout.readline()).decode())
+    await process.wait()
+    report["server"] = stats
+    # Matches a fully busy core would run at once.
+    report["matches_per_core"] = round(
+      args.matches * stats["seconds"] / stats["cpu_seconds"], 1)
+  return report
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Load the match server with random players.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int,
+    help="port of a running server (default: start one)")
+  parser.add_argument("--matches", type=int, default=50,
+    help="matches played at once (default: 50)")
+  parser.add_argument("--players", type=int, default=2,
+    help="players per match (default: 2)")
+  parser.add_argument("--duration", type=float, default=10,
+    help="seconds to run (default: 10)")
+  parser.add_argument("--inputs-per-second", type=float, default=10,
+    help="inputs of each player per second (default: 10)")
+  parser.add_argument("--spectators", type=int, default=0,
+    help="clients watching the latest match (default: 0)")
+  parser.add_argument("--seed", type=int)
+  args = parser.parse_args(argv)
+  print(json.dumps(asyncio.run(run(args)), indent=2))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
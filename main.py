@@ -1,208 +1,211 @@
-import pygame
-from block import *
-from blockgroup import *
-
-def draw_grid(background):
-  grid_color = 50, 50, 50
-  # Vertical lines.
-  for i in range(11):
-    x = TILE_SIZE * i
-    pygame.draw.line(
-      background, grid_color, (x, 0), (x, GRID_HEIGHT)
-    )
-  # Horizontal liens.
-  for i in range(21):
-    y = TILE_SIZE * i
-    pygame.draw.line(
-      background, grid_color, (0, y), (GRID_WIDTH, y)
-    )
-
-def draw_shadow(current_block, group, background):
-  background.fill(BLACK)
-  draw_grid(background)
-  var = current_block.y
-
-  while current_block.rect.bottom <= GRID_HEIGHT and not Block.collide(current_block, group):
-    current_block.y += 1
-  current_block.y -= 1
-
-  for y, row in enumerate(current_block.struct):
-    for x, col in enumerate(row):
-      if col:
-        pygame.draw.rect(
-          background,
-          GREY,
-          pygame.Rect((x + current_block.x) * TILE_SIZE + 1, (y + current_block.y) * TILE_SIZE + 1,
-            TILE_SIZE - 2, TILE_SIZE - 2)
-        )
-  current_block.y = var
-
-def draw_centered_surface1(screen, surface, y):
-  screen.blit(surface, (400 - surface.get_width()/2, y))
-
-def draw_centered_surface2(screen, surface, y):
-  screen.blit(surface, (600 - surface.get_width()/2, y))
-
-def main():
-  pygame.init()
-  pygame.display.set_caption("Tetris - By Tatsuya Yamaguchi")
-  pygame.mixer.music.load("public\korobeiniki.mp3")
-  screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-  top_score = 0
-  run = True
-  paused = False
-  game_over = False
-  # Create background.
-  background = pygame.Surface(screen.get_size())
-  bgcolor = BLACK
-  background.fill(bgcolor)
-  # Draw the grid on top of the background.
-  draw_grid(background)
-  # This makes blitting faster.
-  background = background.convert()
-
-  try:
-    font = pygame.font.Font("public\Roboto-Regular.ttf", 20)
-  except OSError:
-    # If the font file is not available, the default will be used.
-    pass
-  level_msg = font.render(
-    "Nivel:", True, WHITE, bgcolor)
-  next_block_text = font.render(
-    "Siguientes figuras:", True, WHITE, bgcolor)
-  score_msg_text = font.render(
-    "Puntaje:", True, WHITE, bgcolor)
-  hold_block_msg = font.render(
-    "Figura Retenida:", True, WHITE, bgcolor)
-  pause_msg = font.render(
-    "Pausa (P)", True, WHITE, bgcolor)
-  top_score_msg = font.render(
-    "Puntaje maximo:", True, WHITE, bgcolor)
-  game_over_text1= font.render(
-    "GAME OVER", True, (255, 220, 0), bgcolor)
-  game_over_text2= font.render(
-    "Jugar de nuevo (R)", True, (255, 220, 0), bgcolor)
-  game_over_text3= font.render(
-    "Salir del juego (Q)", True, (255, 220, 0), bgcolor)
-
-
-
-  # Event constants.
-  MOVEMENT_KEYS = pygame.K_LEFT, pygame.K_RIGHT, pygame.K_DOWN, pygame.K_SPACE
-  EVENT_UPDATE_CURRENT_BLOCK = pygame.USEREVENT + 1
-  EVENT_MOVE_CURRENT_BLOCK = pygame.USEREVENT + 2
-  pygame.time.set_timer(EVENT_MOVE_CURRENT_BLOCK, 100)
-
-  blocks = BlocksGroup()
-  draw_shadow(blocks.current_block, blocks, background)
-
-  pygame.time.set_timer(EVENT_UPDATE_CURRENT_BLOCK,
-  int(1000 * pow((.8- (blocks.level - 1) * 0.007), (blocks.level - 1))))
-
-  pygame.mixer.music.play(-1)
-
-  pressed_keys = set()
-
-  while run:
-    for event in pygame.event.get():
-      if event.type == pygame.QUIT:
-        run = False
-        break
-      elif event.type == pygame.KEYDOWN:
-        if event.key in MOVEMENT_KEYS:
-          pressed_keys.add(event.key)
-          blocks.start_moving_current_block(event.key)
-      elif event.type == pygame.KEYUP:
-        if not paused and not game_over:
-          if event.key in MOVEMENT_KEYS:
-            pressed_keys.remove(event.key)
-            blocks.stop_moving_current_block()
-          elif event.key == pygame.K_UP:
-            blocks.rotate_current_block_left()
-          elif event.key == pygame.K_z or event.key == pygame.K_LCTRL:
-            blocks.rotate_current_block_right()
-          elif event.key == pygame.K_c and blocks.hold_blocked == False:
-            blocks.hold_current_block()
-          draw_shadow(blocks.current_block, blocks, background)
-        if event.key == pygame.K_p:
-          paused = not paused
-          if paused:
-            pygame.mixer.music.pause()
-          else:
-            pygame.mixer.music.unpause()
-        if game_over:
-          if event.key == pygame.K_r:
-            blocks = BlocksGroup()
-            draw_shadow(blocks.current_block, blocks, background)
-            game_over = False
-          elif event.key == pygame.K_q:
-            run = False
-
-      # Stop moving blocks if the game is over or paused.
-      if game_over or paused:
-        continue
-
-      try:
-        if event.type == EVENT_UPDATE_CURRENT_BLOCK:
-          blocks.update_current_block()
-        elif event.type == EVENT_MOVE_CURRENT_BLOCK:
-          blocks.move_current_block()
-      except TopReached:
-        game_over = True
-
-    if not paused and not game_over:
-        if pressed_keys:
-          for key in pressed_keys:
-              if key in (pygame.K_LEFT, pygame.K_RIGHT):
-                  blocks.start_moving_current_block(key)
-          draw_shadow(blocks.current_block, blocks, background)
-        else:
-          blocks.stop_moving_current_block()
-
-    # Draw background and grid.
-    screen.blit(background, (0, 0))
-    # Blocks.
-    blocks.draw(screen)
-    # Sidebar with misc. information.
-    if not paused:
-      draw_centered_surface1(screen, level_msg, 50)
-      level_text = font.render(
-        str(blocks.level), True, WHITE, bgcolor)
-      draw_centered_surface1(screen, level_text, 80)
-      draw_centered_surface1(screen, next_block_text, 130)
-      draw_centered_surface1(screen, blocks.next_block.image, 180)
-      draw_centered_surface1(screen, blocks.next_block2.image, 330)
-      draw_centered_surface1(screen, blocks.next_block3.image, 480)
-
-      draw_centered_surface2(screen, top_score_msg, 50)
-      top_score_text = font.render(
-        str(top_score), True, WHITE, bgcolor)
-      draw_centered_surface2(screen, top_score_text, 80)
-      draw_centered_surface2(screen, score_msg_text, 130)
-      score_text = font.render(
-        str(blocks.score), True, WHITE, bgcolor)
-      draw_centered_surface2(screen, score_text, 160)
-      draw_centered_surface2(screen, hold_block_msg, 210)
-      if blocks.holded_block:
-        draw_centered_surface2(screen, blocks.holded_block.image, 260)
-
-    else:
-      draw_centered_surface1(screen, pause_msg, 250)
-
-    if game_over:
-      pressed_keys.clear()
-      screen.blit(background, (0, 0))
-      blocks.draw(screen)
-      draw_centered_surface1(screen, game_over_text1, 50)
-      draw_centered_surface1(screen, game_over_text2, 100)
-      draw_centered_surface1(screen, game_over_text3, 150)
-      if blocks.score > top_score:
-        top_score = blocks.score
-
-    # Update.
-    pygame.display.flip()
-
-  pygame.quit()
-
-if __name__ == "__main__":
-  main()
\ No newline at end of file
+import time
+# Measured from here, as close to the start of the process as possible.
+STARTED = time.perf_counter()
+import argparse
+import os
+import threading
+from pathlib import Path
+import pygame
+import replay
+from block import *
+from blockgroup import *
+from renderer import Renderer
+from profiler import FrameProfiler, NullProfiler
+from bot import Bot
+from simulation import Simulation, gravity_period
+
+ASSETS = Path(__file__).parent / "public"
+
+def start_music(ready):
+  """
+  Load and play the music, then set the ready event. It's done in the
+  background, so the first frame doesn't wait for the audio device;
+  the mixer is only used by the game once ready is set.
+  """
+  try:
+    pygame.mixer.init()
+    pygame.mixer.music.load(str(ASSETS / "korobeiniki.mp3"))
+    pygame.mixer.music.play(-1)
+  except pygame.error:
+    # No audio device or no music file: play without music.
+    return
+  ready.set()
+
+def save_replay(blocks, directory):
+  name = "%s-%016x.trp" % (time.strftime("%Y%m%d-%H%M%S"), blocks.game.seed)
+  replay.save(os.path.join(directory, name), replay.from_game(blocks.game))
+
+def main(fps=60, dirty_rects=True, record=None, profile=False,
+    profile_output=None, bot=False, das=0.167, arr=0.033, lock_delay=0.5,
+    music=True, width=10, height=20):
+  """
+  Run the game, drawing at most fps frames per second (no limit if
+  it's 0). See Renderer for dirty_rects. When record is a directory,
+  the replay of each game is saved there once it ends.
+
+  With profile, the time to the first frame is printed and the frame
+  time percentiles are shown on screen; with
+  profile_output, the timings of each frame are written to that file
+  as JSON lines (see profiler.FrameProfiler).
+
+  With bot, the blocks are placed by bot.Bot, one action per frame.
+
+  The game is simulated at a fixed timestep apart from the frames,
+  see simulation.Simulation for das, arr and lock_delay (in seconds).
+  The board is width columns by height rows, and the window grows to
+  fit it.
+  """
+  if profile or profile_output:
+    profiler = FrameProfiler(profile_output)
+  else:
+    profiler = NullProfiler()
+  overlay = None
+  if record:
+    os.makedirs(record, exist_ok=True)
+  # Only what's needed, so no time is spent on the audio device or
+  # the joysticks.
+  pygame.display.init()
+  pygame.font.init()
+  pygame.display.set_caption("Tetris - By Tatsuya Yamaguchi")
+  screen = pygame.display.set_mode(screen_size(width, height))
+  top_score = 0
+  run = True
+  paused = False
+  game_over = False
+  clock = pygame.time.Clock()
+
+  try:
+    font = pygame.font.Font(str(ASSETS / "Roboto-Regular.ttf"), 20)
+  except OSError:
+    # If the font file is not available, the default will be used.
+    font = pygame.font.Font(None, 20)
+  renderer = Renderer(screen, font, dirty_rects, profiler, width, height)
+
+  blocks = BlocksGroup(record=bool(record), width=width, height=height)
+  simulation = Simulation(blocks, das, arr, lock_delay=lock_delay)
+
+  bot_player = Bot() if bot else None
+  bot_block = None
+  bot_actions = []
+
+  music_ready = threading.Event()
+  music_thread = None
+  if music:
+    music_thread = threading.Thread(target=start_music, args=(music_ready,))
+    music_thread.start()
+
+  previous_time = time.perf_counter()
+  while run:
+    with profiler.section("events"):
+      for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+          run = False
+          break
+        elif event.type == pygame.KEYDOWN:
+          if not paused and not game_over and event.key in KEY_ACTIONS:
+            simulation.press(KEY_ACTIONS[event.key])
+        elif event.type == pygame.KEYUP:
+          if event.key in KEY_ACTIONS:
+            simulation.release(KEY_ACTIONS[event.key])
+          if event.key == pygame.K_p:
+            paused = not paused
+            if music_ready.is_set():
+              if paused:
+                pygame.mixer.music.pause()
+              else:
+                pygame.mixer.music.unpause()
+          if game_over:
+            if event.key == pygame.K_r:
+              blocks = BlocksGroup(record=bool(record), width=width,
+                height=height)
+              simulation = Simulation(blocks, das, arr, lock_delay=lock_delay)
+              game_over = False
+            elif event.key == pygame.K_q:
+              run = False
+
+    if bot_player and not paused and not game_over:
+      if blocks.current_block is not bot_block:
+        # The search has to be done before the block falls a row.
+        bot_block = blocks.current_block
+        bot_actions = bot_player.plan(blocks.game,
+          gravity_period(blocks.level))
+      if bot_actions:
+        action = bot_actions.pop(0)
+        simulation.press(action)
+        simulation.release(action)
+
+    now = time.perf_counter()
+    # Stop moving blocks if the game is over or paused.
+    if not paused and not game_over:
+      try:
+        with profiler.section("update"):
+          simulation.advance(now - previous_time)
+      except TopReached:
+        game_over = True
+        if record:
+          save_replay(blocks, record)
+    previous_time = now
+
+    if game_over:
+      if blocks.score > top_score:
+        top_score = blocks.score
+
+    renderer.render(blocks, top_score, paused, game_over, overlay)
+    if profile and profiler.frame == 0:
+      print("first frame after %.0f ms" % (
+        (time.perf_counter() - STARTED) * 1000))
+    if simulation.input_time is not None:
+      profiler.input_latency(time.perf_counter() - simulation.input_time)
+      simulation.input_time = None
+    # Sleep until the next frame is due instead of spinning.
+    clock.tick(fps)
+    profiler.end_frame(blocks)
+    if profile and profiler.frame % 30 == 0:
+      overlay = profiler.summary()
+
+  if record and not game_over:
+    save_replay(blocks, record)
+  profiler.close()
+  if music_thread:
+    # The mixer can't be shut down while it's being set up.
+    music_thread.join()
+  pygame.quit()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Tetris")
+  parser.add_argument("--fps", type=int, default=60,
+    help="frame cap, 0 for no limit (default: 60)")
+  parser.add_argument("--full-redraw", action="store_true",
+    help="redraw the whole screen every frame instead of only what changed")
+  parser.add_argument("--record", metavar="DIR",
+    help="save the replay of each game in DIR")
+  parser.add_argument("--profile", action="store_true",
+    help="show the frame time percentiles on screen")
+  parser.add_argument("--profile-output", metavar="FILE",
+    help="write the timings of each frame to FILE as JSON lines")
+  parser.add_argument("--bot", action="store_true",
+    help="let the bot play")
+  parser.add_argument("--das", type=float, default=0.167,
+    help="seconds before a held move repeats (default: 0.167)")
+  parser.add_argument("--arr", type=float, default=0.033,
+    help="seconds between repeated moves, 0 to go to the wall at once "
+      "(default: 0.033)")
+  parser.add_argument("--lock-delay", type=float, default=0.5,
+    help="seconds a block can stay on the ground before it locks "
+      "(default: 0.5)")
+  parser.add_argument("--no-music", action="store_true",
+    help="don't play music, nor initialize the audio device")
+  parser.add_argument("--width", type=int, default=10,
+    help="columns of the board (default: 10)")
+  parser.add_argument("--height", type=int, default=20,
+    help="rows of the board (default: 20)")
+  args = parser.parse_args()
+  if args.width < 4 or args.height < 4:
+    parser.error("the board must be at least 4x4")
+  if args.record and (args.width, args.height) != (10, 20):
+    # Replays don't store the board size.
+    parser.error("--record needs the standard 10x20 board")
+  main(fps=args.fps, dirty_rects=not args.full_redraw, record=args.record,
+    profile=args.profile, profile_output=args.profile_output, bot=args.bot,
+    das=args.das, arr=args.arr, lock_delay=args.lock_delay,
+    music=not args.no_music, width=args.width, height=args.height)
\ No newline at end of file
@@ -0,0 +1,101 @@
+# Tetromino definitions shared by the game rules and the pygame view.
+# Each struct is the spawn orientation, 1 marking a tile.
+from collections import namedtuple
+import numpy as np
+from board import Board
+
+KINDS = ("O", "T", "I", "L", "Z", "S", "J")
+
+# Id used to tag the tiles of each kind on the board, 0 being empty.
+CELL_IDS = {kind: i + 1 for i, kind in enumerate(KINDS)}
+# Id of the tiles of garbage lines, which aren't from any piece.
+GARBAGE_CELL = len(KINDS) + 1
+
+STRUCTS = {
+  "O": (
+    (1, 1),
+    (1, 1)
+  ),
+  "T": (
+    (1, 1, 1),
+    (0, 1, 0)
+  ),
+  "I": (
+    (1,),
+    (1,),
+    (1,),
+    (1,)
+  ),
+  "L": (
+    (1, 1),
+    (1, 0),
+    (1, 0),
+  ),
+  "Z": (
+    (0, 1),
+    (1, 1),
+    (1, 0),
+  ),
+  "S": (
+    (1, 0),
+    (1, 1),
+    (0, 1),
+  ),
+  "J": (
+    (1, 1),
+    (0, 1),
+    (0, 1),
+  ),
+}
+
+# Rotation tables, computed once at import. Orientation r is the
+# spawn struct turned r quarters clockwise. bottoms holds, for each
+# column of the struct, the offset of its lowest tile.
+Orientation = namedtuple("Orientation", "struct masks bottoms")
+
+def _orientation(struct, rotation):
+  struct = np.rot90(np.array(struct), -rotation)
+  struct.flags.writeable = False
+  bottoms = tuple(
+    len(col) - 1 - int(np.argmax(col[::-1])) for col in struct.T)
+  return Orientation(struct, Board.row_masks(struct), bottoms)
+
+ORIENTATIONS = {
+  kind: tuple(_orientation(struct, r) for r in range(4))
+  for kind, struct in STRUCTS.items()
+}
+
+# Kick tests (dx, dy) tried in order after a clockwise rotation,
+# y growing downwards. Counter-clockwise rotations use them mirrored.
+# Pieces never move up more than one row (two for the I) to fit.
+KICKS = (
+  (0, 0), (-1, 0), (1, 0), (0, -1), (-1, -1), (1, -1)
+)
+I_KICKS = (
+  (0, 0), (-1, 0), (1, 0), (-2, 0), (2, 0), (0, -1), (0, -2)
+)
+
+def _centering_offset(before, after, rotation):
+  # Keep the piece centered. Rounding alternates with the
+  # orientation so a full turn brings it back to its origin.
+  if rotation % 2 == 0:
+    return (before - after) // 2
+  return -((after - before) // 2)
+
+def _rotations(kind):
+  kicks = I_KICKS if kind == "I" else KICKS
+  orientations = ORIENTATIONS[kind]
+  table = [{} for _ in orientations]
+  for r, orientation in enumerate(orientations):
+    height, width = orientation.struct.shape
+    new_r = (r + 1) % 4
+    new_height, new_width = orientations[new_r].struct.shape
+    dx = _centering_offset(width, new_width, r)
+    dy = _centering_offset(height, new_height, r)
+    table[r][1] = (new_r, tuple((dx + kx, dy + ky) for kx, ky in kicks))
+    table[new_r][-1] = (r, tuple((-dx - kx, -dy + ky) for kx, ky in kicks))
+  return tuple(table)
+
+# For each kind and orientation, the (new orientation, kick tests)
+# reached rotating clockwise (1) or counter-clockwise (-1).
+ROTATIONS = {kind: _rotations(kind) for kind in KINDS}
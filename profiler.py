@@ -0,0 +1,135 @@
+import json
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from board import Board
+
+class NullProfiler:
+  """
+  Profiler that does nothing, used when profiling is off.
+  """
+
+  def section(self, name):
+    return nullcontext()
+
+  def end_frame(self, blocks):
+    pass
+
+  def input_latency(self, seconds):
+    pass
+
+  def close(self):
+    pass
+
+
+class FrameProfiler:
+  """
+  Times the sections of each frame and counts collision checks.
+
+  Sections are timed with section(name); a section nested in another
+  one is only counted in the inner one. Collision checks are counted
+  by wrapping Board.collides for as long as the profiler is open.
+  end_frame also notes what happened in the frame (locks, line
+  clears, holds and level ups), so spikes can be tied to them.
+  input_latency notes the time from a key to the frame showing it.
+
+  With path, one JSON object per frame is written there.
+  """
+
+  def __init__(self, path=None, window=300):
+    self.file = open(path, "w") if path else None
+    # Intervals between the last frames, for the percentiles.
+    self.frame_times = deque(maxlen=window)
+    self.latencies = deque(maxlen=window)
+    self._latency = None
+    self.frame = 0
+    self.sections = {}
+    self.collides = 0
+    self._stack = []
+    self._start = self._frame_start = time.perf_counter()
+    self._state = None
+    self._collides = Board.collides
+    def collides(board, *args):
+      self.collides += 1
+      return self._collides(board, *args)
+    Board.collides = collides
+
+  def close(self):
+    Board.collides = self._collides
+    if self.file:
+      self.file.close()
+      self.file = None
+
+  @contextmanager
+  def section(self, name):
+    start = time.perf_counter()
+    self._stack.append(0)
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start
+      nested = self._stack.pop()
+      self.sections[name] = self.sections.get(name, 0) + elapsed - nested
+      if self._stack:
+        self._stack[-1] += elapsed
+
+  def _events(self, blocks):
+    state = (blocks, blocks.pieces_counter, blocks.holded_block,
+      blocks.level)
+    previous, self._state = self._state, state
+    if previous is None or previous[0] is not blocks:
+      return []
+    events = []
+    if state[1] != previous[1]:
+      events.append("lock")
+      if len(blocks.game.cleared_rows):
+        events.append("line_clear:%d" % len(blocks.game.cleared_rows))
+    if state[2] is not previous[2]:
+      events.append("hold")
+    if state[3] != previous[3]:
+      events.append("level_up")
+    return events
+
+  def end_frame(self, blocks):
+    """
+    Close the current frame, blocks being the game it showed.
+    """
+    now = time.perf_counter()
+    frame_time = now - self._frame_start
+    self.frame_times.append(frame_time)
+    if self.file:
+      record = {
+        "frame": self.frame,
+        "time": round(self._frame_start - self._start, 6),
+        "frame_ms": round(frame_time * 1000, 3),
+        "sections_ms": {name: round(seconds * 1000, 3)
+          for name, seconds in self.sections.items()},
+        "collides": self.collides,
+        "input_latency_ms": self._latency and round(self._latency * 1000, 3),
+        "events": self._events(blocks),
+      }
+      self.file.write(json.dumps(record) + "\n")
+    self.frame += 1
+    self.sections = {}
+    self.collides = 0
+    self._latency = None
+    self._frame_start = now
+
+  def input_latency(self, seconds):
+    self.latencies.append(seconds)
+    self._latency = seconds
+
+  def percentile(self, p, times=None):
+    """
+    Return the p-th percentile of the last frame times, or of times,
+    in seconds.
+    """
+    times = sorted(self.frame_times if times is None else times)
+    if not times:
+      return 0
+    return times[min(int(len(times) * p / 100), len(times) - 1)]
+
+  def summary(self):
+    return "p50 %.1f ms  p99 %.1f ms  input p99 %.1f ms" % (
+      self.percentile(50) * 1000, self.percentile(99) * 1000,
+      self.percentile(99, self.latencies) * 1000)
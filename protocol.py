@@ -0,0 +1,177 @@
+"""
+Binary protocol of the match server.
+
+Every message is framed as its length (uint16) followed by its type
+(uint8) and its fields, integers being little endian:
+
+  JOIN   client  players wanted in the match (uint8)
+  WATCH  client  match id to spectate (uint32), 0 for the latest one
+  INPUT  client  tick (uint32), action of game.py (uint8)
+  START  server  match id (uint32), player index (uint8, NO_PLAYER
+                 for spectators), players (uint8), seed (uint64)
+  STATE  server  player (uint8), tick of the last input applied
+                 (uint32), then a state delta
+  OVER   server  player (uint8), place (uint8)
+
+A state delta holds the parts of a game state (see Game.snapshot) that
+changed since the previous one sent for the same player. It starts
+with a byte of flags telling which parts follow:
+
+  CURRENT  kind (uint8, index in KINDS), rotation (uint8), x, y (int8)
+  QUEUE    the next three kinds (uint8 each)
+  HOLD     held kind (uint8, NO_KIND when none)
+  SCORE    score (uint32), level (uint16), lines counter (uint16)
+  ROWS     count (uint8), then for each row its index (uint8) and
+           its cell ids (one uint8 per column)
+
+A delta from no previous state has every part and every row, and is
+a keyframe.
+"""
+import struct
+import numpy as np
+from pieces import KINDS
+
+JOIN, INPUT, START, STATE, OVER, WATCH = range(1, 7)
+
+LENGTH = struct.Struct("<H")
+TYPE = struct.Struct("<B")
+MESSAGES = {
+  JOIN: struct.Struct("<BB"),
+  INPUT: struct.Struct("<BIB"),
+  START: struct.Struct("<BIBBQ"),
+  STATE: struct.Struct("<BBI"),
+  OVER: struct.Struct("<BBB"),
+  WATCH: struct.Struct("<BI"),
+}
+NO_PLAYER = 255
+
+CURRENT, QUEUE, HOLD, SCORE, ROWS = (1 << i for i in range(5))
+PIECE = struct.Struct("<BBbb")
+SCORES = struct.Struct("<IHH")
+NO_KIND = 255
+
+class ProtocolError(Exception):
+  pass
+
+def pack(kind, *fields, payload=b""):
+  """
+  Return a framed message of the given type.
+  """
+  body = MESSAGES[kind].pack(kind, *fields) + payload
+  return LENGTH.pack(len(body)) + body
+
+def unpack(body):
+  """
+  Return (type, fields, payload) of a message body, without its length.
+  """
+  if not body:
+    raise ProtocolError("empty message")
+  kind = body[0]
+  if kind not in MESSAGES:
+    raise ProtocolError("unknown message type %d" % kind)
+  message = MESSAGES[kind]
+  if len(body) < message.size:
+    raise ProtocolError("truncated message")
+  return kind, message.unpack_from(body)[1:], body[message.size:]
+
+async def read_message(reader):
+  """
+  Read a message from an asyncio stream. Return (type, fields,
+  payload), or None at the end of the stream.
+  """
+  try:
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return unpack(await reader.readexactly(length))
+  except EOFError:
+    return None
+
+def _kind(kind):
+  return NO_KIND if kind is None else KINDS.index(kind)
+
+def encode_delta(previous, state):
+  """
+  Return the delta from a GameState to another one. previous is None
+  for a keyframe.
+  """
+  flags = 0
+  out = bytearray(1)
+  if previous is None or previous.current != state.current:
+    flags |= CURRENT
+    kind, rotation, x, y = state.current
+    out += PIECE.pack(_kind(kind), rotation, x, y)
+  if previous is None or previous.queue != state.queue:
+    flags |= QUEUE
+    out += bytes(_kind(kind) for kind in state.queue)
+  if previous is None or previous.hold != state.hold:
+    flags |= HOLD
+    out.append(_kind(state.hold))
+  scores = (state.score, state.level, state.lines_counter)
+  if previous is None or scores != (
+      previous.score, previous.level, previous.lines_counter):
+    flags |= SCORE
+    out += SCORES.pack(*scores)
+  rows, cells, _ = state.board
+  if previous is None:
+    changed = range(len(rows))
+  elif previous.board[1] is cells:
+    # Snapshots share the cells until the board changes.
+    changed = ()
+  else:
+    # Rows are compared by cell ids rather than by bitmask, as garbage
+    # and line clears can move tiles of another kind into a row.
+    changed = (previous.board[1] != cells).any(axis=1).nonzero()[0].tolist()
+  if changed:
+    flags |= ROWS
+    out.append(len(changed))
+    for y in changed:
+      out.append(y)
+      out += cells[y].tobytes()
+  out[0] = flags
+  return bytes(out)
+
+
+class PlayerView:
+  """
+  A game as seen through the deltas of its states: the cell ids of the
+  board, the current block as (kind, rotation, x, y), the next kinds,
+  the held kind and the scores.
+  """
+
+  def __init__(self, width=10, height=20):
+    self.cells = np.zeros((height, width), dtype=np.int8)
+    self.current = None
+    self.queue = ()
+    self.hold = None
+    self.score = self.level = self.lines_counter = 0
+
+  def apply(self, delta):
+    """
+    Update the view with a delta from encode_delta.
+    """
+    flags = delta[0]
+    offset = 1
+    if flags & CURRENT:
+      kind, rotation, x, y = PIECE.unpack_from(delta, offset)
+      self.current = (KINDS[kind], rotation, x, y)
+      offset += PIECE.size
+    if flags & QUEUE:
+      self.queue = tuple(KINDS[kind] for kind in delta[offset:offset + 3])
+      offset += 3
+    if flags & HOLD:
+      kind = delta[offset]
+      self.hold = None if kind == NO_KIND else KINDS[kind]
+      offset += 1
+    if flags & SCORE:
+      self.score, self.level, self.lines_counter = SCORES.unpack_from(
+        delta, offset)
+      offset += SCORES.size
+    if flags & ROWS:
+      width = self.cells.shape[1]
+      count = delta[offset]
+      offset += 1
+      for _ in range(count):
+        y = delta[offset]
+        self.cells[y] = np.frombuffer(delta, np.int8, width, offset + 1)
+        offset += 1 + width
+    if offset != len(delta):
+      raise ProtocolError("bad delta")
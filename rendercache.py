@@ -0,0 +1,33 @@
+from collections import OrderedDict
+
+class RenderCache:
+  """
+  Bounded cache of rendered surfaces. render is called with the key
+  arguments the first time they are asked for; once maxsize surfaces
+  are kept, the least recently used one is evicted.
+  """
+
+  def __init__(self, render, maxsize=128):
+    self.render = render
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._surfaces = OrderedDict()
+
+  def __len__(self):
+    return len(self._surfaces)
+
+  def __call__(self, *key):
+    surface = self._surfaces.get(key)
+    if surface is not None:
+      self.hits += 1
+      self._surfaces.move_to_end(key)
+      return surface
+    self.misses += 1
+    surface = self._surfaces[key] = self.render(*key)
+    if len(self._surfaces) > self.maxsize:
+      self._surfaces.popitem(last=False)
+    return surface
+
+  def clear(self):
+    self._surfaces.clear()
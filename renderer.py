@@ -0,0 +1,233 @@
+import pygame
+from block import *
+from rendercache import RenderCache
+from profiler import NullProfiler
+
+def draw_grid(background, width=10, height=20):
+  grid_color = 50, 50, 50
+  # Vertical lines.
+  for i in range(width + 1):
+    x = TILE_SIZE * i
+    pygame.draw.line(
+      background, grid_color, (x, 0), (x, height * TILE_SIZE)
+    )
+  # Horizontal liens.
+  for i in range(height + 1):
+    y = TILE_SIZE * i
+    pygame.draw.line(
+      background, grid_color, (0, y), (width * TILE_SIZE, y)
+    )
+
+def shadow_position(current_block, group):
+  """
+  Return the row where the current block would land.
+  """
+  return current_block.y + group.drop_distance()
+
+def draw_shadow(current_block, y, surface):
+  rows, cols = current_block.struct.nonzero()
+  draw_tiles(surface, ((x + current_block.x, row + y, GREY)
+    for row, x in zip(rows.tolist(), cols.tolist())))
+
+def draw_centered_surface(screen, surface, x, y):
+  return screen.blit(surface, (x - surface.get_width()/2, y))
+
+
+class Renderer:
+  """
+  Draws the game on the screen.
+
+  With dirty_rects, only the regions that changed since the last
+  frame are drawn and sent to the display with display.update: the
+  current block and its shadow, and the sidebar fields whose value
+  changed. The whole board is only redrawn when a block locks, and
+  the whole screen when the game is paused, resumed, over or
+  restarted. Without it every frame is drawn from scratch and
+  flipped.
+
+  profiler times the shadow, the sprites and the display update (see
+  profiler.FrameProfiler). width and height are the size of the board
+  in tiles; the sidebar is drawn right of it.
+  """
+
+  def __init__(self, screen, font, dirty_rects=True, profiler=None,
+      width=10, height=20):
+    self.screen = screen
+    self.board_rect = pygame.Rect(0, 0, width * TILE_SIZE,
+      height * TILE_SIZE)
+    self.font = font
+    self.dirty_rects = dirty_rects
+    self.profiler = profiler or NullProfiler()
+    self.bgcolor = BLACK
+    # Rendered numbers of the sidebar, so a value is only rasterized
+    # the first time it is shown.
+    self.texts = RenderCache(
+      lambda value: font.render(str(value), True, WHITE, self.bgcolor))
+    # Background with the grid on it.
+    background = pygame.Surface(screen.get_size())
+    background.fill(self.bgcolor)
+    draw_grid(background, width, height)
+    # This makes blitting faster.
+    self.background = background.convert()
+    self.level_msg = font.render(
+      "Nivel:", True, WHITE, self.bgcolor)
+    self.next_block_text = font.render(
+      "Siguientes figuras:", True, WHITE, self.bgcolor)
+    self.score_msg_text = font.render(
+      "Puntaje:", True, WHITE, self.bgcolor)
+    self.hold_block_msg = font.render(
+      "Figura Retenida:", True, WHITE, self.bgcolor)
+    self.pause_msg = font.render(
+      "Pausa (P)", True, WHITE, self.bgcolor)
+    self.top_score_msg = font.render(
+      "Puntaje maximo:", True, WHITE, self.bgcolor)
+    self.game_over_text1 = font.render(
+      "GAME OVER", True, (255, 220, 0), self.bgcolor)
+    self.game_over_text2 = font.render(
+      "Jugar de nuevo (R)", True, (255, 220, 0), self.bgcolor)
+    self.game_over_text3 = font.render(
+      "Salir del juego (Q)", True, (255, 220, 0), self.bgcolor)
+    self.invalidate()
+
+  def invalidate(self):
+    """
+    Force the next frame to be drawn from scratch.
+    """
+    self._screen_state = None
+    self._board_state = None
+    self._block_rects = []
+    self._fields = {}
+
+  def _block_rects_for(self, blocks, shadow_y):
+    block = blocks.current_block
+    shadow = block.rect.copy()
+    shadow.top = shadow_y * TILE_SIZE
+    return [block.rect.clip(self.board_rect),
+      shadow.clip(self.board_rect)]
+
+  def _draw_board(self, blocks, shadow_y, area):
+    self.screen.set_clip(area)
+    self.screen.blit(self.background, area, area)
+    with self.profiler.section("shadow"):
+      draw_shadow(blocks.current_block, shadow_y, self.screen)
+    with self.profiler.section("sprites"):
+      blocks.draw(self.screen)
+    self.screen.set_clip(None)
+
+  def _render_board(self, blocks):
+    block = blocks.current_block
+    state = (blocks.board.version, block.kind, block.rotation,
+      block.x, block.y)
+    if state == self._board_state:
+      return []
+    shadow_y = shadow_position(block, blocks)
+    rects = self._block_rects_for(blocks, shadow_y)
+    if (self._board_state is not None
+        and state[0] == self._board_state[0]):
+      # Only the current block moved.
+      dirty = self._block_rects + rects
+    else:
+      dirty = [self.board_rect]
+    for area in dirty:
+      self._draw_board(blocks, shadow_y, area)
+    self._board_state = state
+    self._block_rects = rects
+    return dirty
+
+  def _field(self, name, value, draw):
+    """
+    Draw a sidebar field if its value changed since the last frame.
+    draw blits the field and returns the rect it covers.
+    """
+    previous = self._fields.get(name)
+    if previous is not None and previous[0] == value:
+      return []
+    dirty = []
+    if previous is not None:
+      self.screen.fill(self.bgcolor, previous[1])
+      dirty.append(previous[1])
+    rect = draw()
+    self._fields[name] = (value, rect)
+    dirty.append(rect)
+    return dirty
+
+  def _sidebar1(self, surface, y):
+    return draw_centered_surface(self.screen, surface,
+      self.board_rect.width + 100, y)
+
+  def _sidebar2(self, surface, y):
+    return draw_centered_surface(self.screen, surface,
+      self.board_rect.width + 300, y)
+
+  def _text(self, value):
+    return self.texts(value)
+
+  def _preview(self, block):
+    return PIECE_IMAGES(block.kind, block.rotation)
+
+  def _render_sidebar(self, blocks, top_score):
+    dirty = []
+    dirty += self._field("level_msg", None,
+      lambda: self._sidebar1(self.level_msg, 50))
+    dirty += self._field("level", blocks.level,
+      lambda: self._sidebar1(self._text(blocks.level), 80))
+    dirty += self._field("next_block_text", None,
+      lambda: self._sidebar1(self.next_block_text, 130))
+    for name, y in (("next_block", 180), ("next_block2", 330),
+        ("next_block3", 480)):
+      block = getattr(blocks, name)
+      dirty += self._field(name, block,
+        lambda: self._sidebar1(self._preview(block), y))
+    dirty += self._field("top_score_msg", None,
+      lambda: self._sidebar2(self.top_score_msg, 50))
+    dirty += self._field("top_score", top_score,
+      lambda: self._sidebar2(self._text(top_score), 80))
+    dirty += self._field("score_msg_text", None,
+      lambda: self._sidebar2(self.score_msg_text, 130))
+    dirty += self._field("score", blocks.score,
+      lambda: self._sidebar2(self._text(blocks.score), 160))
+    dirty += self._field("hold_block_msg", None,
+      lambda: self._sidebar2(self.hold_block_msg, 210))
+    if blocks.holded_block:
+      dirty += self._field("holded_block", blocks.holded_block,
+        lambda: self._sidebar2(self._preview(blocks.holded_block), 260))
+    return dirty
+
+  def _render_overlay(self, text):
+    def draw():
+      surface = self.font.render(text, True, GREY, self.bgcolor)
+      width, height = self.screen.get_size()
+      return self.screen.blit(surface, (width - surface.get_width() - 5,
+        height - surface.get_height() - 5))
+    return self._field("overlay", text, draw)
+
+  def render(self, blocks, top_score, paused, game_over, overlay=None):
+    """
+    Draw a frame and send it to the display. overlay is a line of text
+    shown in the bottom right corner.
+    """
+    screen_state = (blocks, paused, game_over)
+    full = not self.dirty_rects or screen_state != self._screen_state
+    if full:
+      self.invalidate()
+      self._screen_state = screen_state
+      self.screen.blit(self.background, (0, 0))
+    dirty = self._render_board(blocks)
+    if game_over:
+      # The game over texts take the place of the sidebar.
+      if full:
+        self._sidebar1(self.game_over_text1, 50)
+        self._sidebar1(self.game_over_text2, 100)
+        self._sidebar1(self.game_over_text3, 150)
+    elif not paused:
+      dirty += self._render_sidebar(blocks, top_score)
+    elif full:
+      self._sidebar1(self.pause_msg, 250)
+    if overlay:
+      dirty += self._render_overlay(overlay)
+
+    with self.profiler.section("flip"):
+      if full:
+        pygame.display.flip()
+      elif dirty:
+        pygame.display.update(dirty)
@@ -0,0 +1,161 @@
+"""
+Replays: the seed and the tick-stamped inputs of a game, which is
+enough to simulate it again exactly, plus its final score and board
+hash to check the simulation against.
+
+Binary format, integers being little endian:
+
+  header  b"TRP1" and the seed (uint64)
+  inputs  one varint per input: (ticks since the previous one << 3)
+          | action
+  footer  the varint (ticks since the last input << 3) | END, then
+          the final score (int64) and board hash (uint64)
+
+Usage: python replay.py REPLAY_OR_DIRECTORY...
+"""
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from game import Game, TopReached
+
+MAGIC = b"TRP1"
+HEADER = struct.Struct("<4sQ")
+FOOTER = struct.Struct("<qQ")
+# Action code marking the footer.
+END = 7
+
+Replay = namedtuple("Replay", "seed inputs ticks score board_hash")
+
+class ReplayError(Exception):
+  pass
+
+def board_hash(board):
+  """
+  Return a 64 bits hash of the locked tiles.
+  """
+  digest = hashlib.blake2b(board.cells.tobytes(), digest_size=8).digest()
+  return int.from_bytes(digest, "little")
+
+def _write_varint(out, value):
+  while value >= 0x80:
+    out.append(value & 0x7f | 0x80)
+    value >>= 7
+  out.append(value)
+
+def _read_varint(data, offset):
+  value = shift = 0
+  while True:
+    if offset >= len(data):
+      raise ReplayError("truncated replay")
+    byte = data[offset]
+    offset += 1
+    value |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return value, offset
+    shift += 7
+
+def from_game(game):
+  """
+  Build the replay of a game created with record=True.
+  """
+  return Replay(game.seed, list(game.inputs), game.ticks, game.score,
+    board_hash(game.board))
+
+def encode(replay):
+  out = bytearray(HEADER.pack(MAGIC, replay.seed))
+  ticks = 0
+  for tick, action in replay.inputs:
+    _write_varint(out, (tick - ticks) << 3 | action)
+    ticks = tick
+  _write_varint(out, (replay.ticks - ticks) << 3 | END)
+  out += FOOTER.pack(replay.score, replay.board_hash)
+  return bytes(out)
+
+def decode(data):
+  if len(data) < HEADER.size or data[:4] != MAGIC:
+    raise ReplayError("not a replay")
+  _, seed = HEADER.unpack_from(data)
+  offset = HEADER.size
+  inputs = []
+  ticks = 0
+  while True:
+    value, offset = _read_varint(data, offset)
+    ticks += value >> 3
+    action = value & 7
+    if action == END:
+      break
+    inputs.append((ticks, action))
+  if len(data) - offset != FOOTER.size:
+    raise ReplayError("bad footer")
+  score, hash_ = FOOTER.unpack_from(data, offset)
+  return Replay(seed, inputs, ticks, score, hash_)
+
+def save(path, replay):
+  with open(path, "wb") as f:
+    f.write(encode(replay))
+
+def load(path):
+  with open(path, "rb") as f:
+    return decode(f.read())
+
+def play(replay):
+  """
+  Simulate a replay without any rendering, as fast as possible, and
+  return the game at its end.
+  """
+  game = Game(seed=replay.seed)
+  try:
+    for tick, action in replay.inputs:
+      while game.ticks < tick:
+        game.update_current_block()
+      game.apply(action)
+    while game.ticks < replay.ticks:
+      game.update_current_block()
+  except TopReached:
+    pass
+  return game
+
+def verify(replay):
+  """
+  Play a replay and check it ends with its recorded score and board.
+  """
+  game = play(replay)
+  return (game.score == replay.score
+    and board_hash(game.board) == replay.board_hash)
+
+def _paths(paths):
+  for path in paths:
+    if os.path.isdir(path):
+      for name in sorted(os.listdir(path)):
+        yield os.path.join(path, name)
+    else:
+      yield path
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Replay recorded games and check their final state.")
+  parser.add_argument("paths", nargs="+", metavar="REPLAY_OR_DIRECTORY")
+  args = parser.parse_args(argv)
+  games = failures = 0
+  start = time.perf_counter()
+  for path in _paths(args.paths):
+    games += 1
+    try:
+      replay = load(path)
+    except ReplayError as e:
+      failures += 1
+      print(f"{path}: {e}")
+      continue
+    if not verify(replay):
+      failures += 1
+      print(f"{path}: final state differs")
+  elapsed = time.perf_counter() - start
+  print(f"{games} replays, {failures} failed, {elapsed:.2f}s")
+  return 1 if failures else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Asyncio server running multiplayer matches authoritatively.
+
+Clients join asking for a number of players (2 for head to head,
+more for battle royale) and are put in a match once enough of them
+wait. Every game of a match is simulated on the server at a fixed
+tick, with the same seed for every player. Inputs are applied as
+they arrive and acknowledged with the delta of the player's state,
+which is also sent to the rest of the match. See protocol.py.
+
+Spectators watch a match without playing: they are sent the keyframe
+of every game, then the same state messages as the players, each one
+encoded once for all of them (see broadcast.py).
+
+Clearing lines sends garbage lines to an opponent (a random one in
+battle royale). They wait until the receiver locks a block without
+clearing lines, and lines cleared before that cancel them.
+
+Usage: python server.py [--host HOST] [--port PORT]
+"""
+import argparse
+import asyncio
+import json
+import random
+import signal
+import sys
+import time
+from broadcast import Channel
+from game import Game, TopReached, HOLD
+from protocol import (JOIN, WATCH, INPUT, START, STATE, OVER, NO_PLAYER,
+  ProtocolError, pack, read_message)
+from simulation import Simulation
+
+TICK = 1 / 60
+# Garbage lines sent for 0 to 4 lines cleared at once. Combos add one
+# more line every two steps.
+GARBAGE_LINES = (0, 0, 1, 2, 4)
+
+def attack(lines, combo):
+  """
+  Return the garbage lines sent for clearing lines, combo being the
+  combo counter after the clear.
+  """
+  if not lines:
+    return 0
+  return GARBAGE_LINES[lines] + combo // 2
+
+
+class Player:
+
+  def __init__(self, writer, index, seed):
+    self.writer = writer
+    self.index = index
+    self.game = Game(seed=seed)
+    self.simulation = Simulation(self.game)
+    # Tick of the last input applied.
+    self.tick = 0
+    # Stream of the states of the game to the match.
+    self.channel = Channel(index)
+    self.garbage = 0
+    # Place in the match once out of it.
+    self.place = None
+
+
+class Match:
+  """
+  Games of players simulated in lockstep.
+  """
+
+  def __init__(self, match_id, writers, seed):
+    self.id = match_id
+    self.seed = seed
+    self.random = random.Random(seed)
+    self.players = [Player(writer, i, seed)
+      for i, writer in enumerate(writers)]
+    self.spectators = set()
+    for player in self.players:
+      for other in self.players:
+        other.channel.subscribe(player.writer)
+
+  @property
+  def alive(self):
+    return [player for player in self.players if player.place is None]
+
+  @property
+  def finished(self):
+    return len(self.alive) <= (1 if len(self.players) > 1 else 0)
+
+  def _send_all(self, message):
+    for player in self.players:
+      if not player.writer.is_closing():
+        player.writer.write(message)
+    for writer in self.spectators:
+      writer.write(message)
+
+  def start(self):
+    for player in self.players:
+      player.writer.write(pack(START, self.id, player.index,
+        len(self.players), self.seed))
+    for player in self.players:
+      self._send_state(player)
+
+  def _send_state(self, player, ack=False):
+    """
+    Send the delta of a player's state to the match. With ack, an
+    empty delta is sent to the player when nothing changed.
+    """
+    message = player.channel.publish(player.game.snapshot(), player.tick)
+    if message is None and ack and not player.writer.is_closing():
+      player.writer.write(pack(STATE, player.index, player.tick,
+        payload=bytes(1)))
+
+  def watch(self, writer):
+    """
+    Add a spectator, sending it the match as it is now.
+    """
+    writer.write(pack(START, self.id, NO_PLAYER, len(self.players),
+      self.seed))
+    self.spectators.add(writer)
+    for player in self.players:
+      player.channel.subscribe(writer)
+      if player.place is not None:
+        writer.write(pack(OVER, player.index, player.place))
+
+  def leave(self, writer):
+    """
+    Stop sending the match to a player or spectator that is gone.
+    """
+    self.spectators.discard(writer)
+    for player in self.players:
+      player.channel.unsubscribe(writer)
+
+  def close(self):
+    for writer in self.spectators:
+      writer.close()
+
+  def eliminate(self, player):
+    if player.place is not None:
+      return
+    player.place = len(self.alive)
+    self._send_all(pack(OVER, player.index, player.place))
+    if self.finished:
+      for winner in self.alive:
+        winner.place = 1
+        self._send_all(pack(OVER, winner.index, 1))
+
+  def _run(self, player, function, *args):
+    """
+    Call function of the player's simulation, then handle the blocks
+    it locked.
+    """
+    game = player.game
+    pieces = game.pieces_counter
+    try:
+      function(*args)
+      if game.pieces_counter != pieces:
+        self._locked(player)
+    except TopReached:
+      self.eliminate(player)
+
+  def _locked(self, player):
+    game = player.game
+    lines = len(game.cleared_rows)
+    sent = attack(lines, game.combo_counter)
+    if lines:
+      cancelled = min(sent, player.garbage)
+      player.garbage -= cancelled
+      sent -= cancelled
+    elif player.garbage:
+      game.add_garbage(player.garbage, self.random.randrange(game.board.width))
+      player.garbage = 0
+    opponents = [p for p in self.alive if p is not player]
+    if sent and opponents:
+      self.random.choice(opponents).garbage += sent
+
+  def input(self, player, tick, action):
+    if player.place is not None or tick < player.tick:
+      return
+    player.tick = tick
+    simulation = player.simulation
+    simulation.press(action)
+    simulation.release(action)
+    self._run(player, simulation.advance, 0)
+    self._send_state(player, ack=True)
+
+  def step(self):
+    for player in self.alive:
+      self._run(player, player.simulation.advance, TICK)
+    for player in self.players:
+      self._send_state(player)
+
+
+class MatchServer:
+
+  def __init__(self, seed=None):
+    self.random = random.Random(seed)
+    # Clients waiting for a match, by players wanted, as
+    # (writer, future of their match and player).
+    self.waiting = {}
+    self.matches = {}
+    self.matches_started = 0
+    self.max_matches = 0
+
+  async def handle(self, reader, writer):
+    player = match = future = None
+    try:
+      message = await read_message(reader)
+      if message is None:
+        return
+      if message[0] == WATCH:
+        await self._watch(message[1][0], reader, writer)
+        return
+      if message[0] != JOIN or not message[1][0]:
+        return
+      players = message[1][0]
+      future = asyncio.get_running_loop().create_future()
+      waiting = self.waiting.setdefault(players, [])
+      waiting.append((writer, future))
+      if len(waiting) == players:
+        del self.waiting[players]
+        self._start(waiting)
+      match, player = await future
+      while True:
+        message = await read_message(reader)
+        if message is None:
+          break
+        kind, fields, _ = message
+        if kind == INPUT:
+          if fields[1] > HOLD:
+            raise ProtocolError("unknown action %d" % fields[1])
+          match.input(player, *fields)
+    except (ProtocolError, ConnectionError):
+      pass
+    finally:
+      if player is not None:
+        match.leave(writer)
+        match.eliminate(player)
+      elif future is not None and not future.done():
+        self.waiting[players].remove((writer, future))
+      writer.close()
+
+  async def _watch(self, match_id, reader, writer):
+    match = self.matches.get(match_id or max(self.matches, default=0))
+    if match is None:
+      return
+    match.watch(writer)
+    try:
+      # Spectators only close the connection.
+      while await read_message(reader) is not None:
+        pass
+    finally:
+      match.leave(writer)
+
+  def _start(self, waiting):
+    self.matches_started += 1
+    match = Match(self.matches_started, [writer for writer, _ in waiting],
+      self.random.getrandbits(64))
+    self.matches[match.id] = match
+    self.max_matches = max(self.max_matches, len(self.matches))
+    for player, (_, future) in zip(match.players, waiting):
+      future.set_result((match, player))
+    match.start()
+
+  async def run_ticks(self):
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+      next_tick += TICK
+      await asyncio.sleep(max(next_tick - loop.time(), 0))
+      for match in list(self.matches.values()):
+        match.step()
+        if match.finished:
+          del self.matches[match.id]
+          match.close()
+
+  def stats(self):
+    return {
+      "matches_started": self.matches_started,
+      "max_concurrent_matches": self.max_matches,
+      "cpu_seconds": round(time.process_time(), 3),
+    }
+
+
+async def serve(host, port, seed=None):
+  server = MatchServer(seed)
+  listener = await asyncio.start_server(server.handle, host, port)
+  host, port = listener.sockets[0].getsockname()[:2]
+  print("listening on %s:%d" % (host, port), flush=True)
+  stop = asyncio.Event()
+  loop = asyncio.get_running_loop()
+  for signum in (signal.SIGINT, signal.SIGTERM):
+    loop.add_signal_handler(signum, stop.set)
+  ticks = asyncio.create_task(server.run_ticks())
+  start = time.perf_counter()
+  async with listener:
+    await stop.wait()
+  ticks.cancel()
+  stats = server.stats()
+  stats["seconds"] = round(time.perf_counter() - start, 3)
+  print(json.dumps(stats), flush=True)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Run the match server.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=7777,
+    help="0 for any free port (default: 7777)")
+  parser.add_argument("--seed", type=int, help="seed of the match seeds")
+  args = parser.parse_args(argv)
+  asyncio.run(serve(args.host, args.port, args.seed))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Fixed timestep simulation of a game driven by held keys.
+
+The game is stepped STEP seconds at a time, however often frames are
+drawn. Keys are pressed and released as actions of game.py:
+
+  LEFT, RIGHT  move once when pressed, then again after DAS (delayed
+               auto shift) and every ARR (auto repeat rate) while held
+  SOFT_DROP    moves down once when pressed, then every soft drop
+               period while held
+  others       are applied once when pressed
+
+Gravity speeds up with the level. A block that can't fall any more
+locks after the lock delay; moving or rotating it starts the delay
+again, up to MAX_LOCK_RESETS times.
+"""
+import time
+from game import LEFT, RIGHT, SOFT_DROP
+
+STEP = 1 / 240
+MAX_LOCK_RESETS = 15
+# Longest time simulated at once, so a stall doesn't turn into a
+# burst of steps.
+MAX_ADVANCE = 0.25
+
+def gravity_period(level):
+  """
+  Return the seconds between two rows of fall at a level.
+  """
+  return pow(.8 - (level - 1) * 0.007, level - 1)
+
+
+class Simulation:
+  """
+  Steps a Game, or a view with the same methods such as BlocksGroup.
+  Times are in seconds.
+
+  input_time is when the oldest action not shown yet was pressed, or
+  None. Whoever draws the frames clears it once a frame with the
+  action applied is on the screen, measuring the latency from the key
+  to the screen.
+  """
+
+  def __init__(self, game, das=0.167, arr=0.033, soft_drop_period=0.033,
+      lock_delay=0.5):
+    self.game = game
+    self.das = das
+    self.arr = arr
+    self.soft_drop_period = soft_drop_period
+    self.lock_delay = lock_delay
+    self.pressed = []
+    self.held = []
+    self.input_time = None
+    self._lag = 0
+    self._shift_timer = 0
+    self._soft_drop_timer = 0
+    self._gravity_timer = 0
+    self._lock_timer = 0
+    self._lock_resets = 0
+
+  def press(self, action):
+    self.pressed.append(action)
+    if self.input_time is None:
+      self.input_time = time.perf_counter()
+    if action in (LEFT, RIGHT, SOFT_DROP):
+      if action in self.held:
+        self.held.remove(action)
+      self.held.append(action)
+
+  def release(self, action):
+    if action in self.held:
+      shift = self._shift_held()
+      self.held.remove(action)
+      if self._shift_held() != shift:
+        self._shift_timer = self.das
+
+  def _shift_held(self):
+    # The direction pressed last wins.
+    for action in reversed(self.held):
+      if action != SOFT_DROP:
+        return action
+
+  def _apply(self, action):
+    block = self.game.current_block
+    state = (block.rotation, block.x, block.y)
+    self.game.apply(action)
+    if self.game.current_block is not block:
+      # Locked or held.
+      self._new_block()
+    elif (block.rotation, block.x, block.y) != state:
+      # Moving a block on the ground gives it more time.
+      if self._lock_resets < MAX_LOCK_RESETS and self._lock_timer:
+        self._lock_timer = 0
+        self._lock_resets += 1
+
+  def _new_block(self):
+    self._gravity_timer = 0
+    self._lock_timer = 0
+    self._lock_resets = 0
+
+  def _shift(self, action):
+    if self.arr:
+      self._apply(action)
+    else:
+      # Straight to the wall.
+      for _ in range(self.game.board.width):
+        self._apply(action)
+
+  def step(self):
+    game = self.game
+    shift = self._shift_held()
+    if shift is not None:
+      self._shift_timer -= STEP
+      while self._shift_timer <= 0:
+        self._shift(shift)
+        self._shift_timer += self.arr or STEP
+
+    if SOFT_DROP in self.held:
+      self._soft_drop_timer = max(self._soft_drop_timer - STEP, 0)
+      if self._soft_drop_timer <= 0 and game.drop_distance():
+        self._apply(SOFT_DROP)
+        self._soft_drop_timer += self.soft_drop_period
+        self._gravity_timer = 0
+
+    if game.drop_distance():
+      self._lock_timer = 0
+      self._gravity_timer += STEP
+      period = gravity_period(game.level)
+      while self._gravity_timer >= period and game.drop_distance():
+        self._gravity_timer -= period
+        game.update_current_block()
+    else:
+      self._lock_timer += STEP
+      if self._lock_timer >= self.lock_delay:
+        # Gravity locks it.
+        game.update_current_block()
+        self._new_block()
+
+  def advance(self, seconds):
+    """
+    Apply the pressed actions and simulate the given time.
+    """
+    pressed, self.pressed = self.pressed, []
+    for action in pressed:
+      if action in (LEFT, RIGHT):
+        self._shift_timer = self.das
+        self._apply(action)
+      elif action == SOFT_DROP:
+        self._soft_drop_timer = self.soft_drop_period
+        if self.game.drop_distance():
+          self._apply(action)
+          self._gravity_timer = 0
+      else:
+        self._apply(action)
+    self._lag += min(seconds, MAX_ADVANCE)
+    while self._lag >= STEP:
+      self._lag -= STEP
+      self.step()
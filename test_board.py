@@ -0,0 +1,20 @@
+import unittest
+from board import Board
+from pieces import ORIENTATIONS
+
+
+class DropDistanceTest(unittest.TestCase):
+
+  def test_from_above_the_board(self):
+    board = Board()
+    for orientation in ORIENTATIONS["I"]:
+      for y in (-4, -2, 0):
+        distance = board.drop_distance(orientation.masks,
+          orientation.bottoms, 3, y)
+        self.assertFalse(board.collides(orientation.masks, 3, y + distance))
+        self.assertTrue(
+          board.collides(orientation.masks, 3, y + distance + 1))
+
+
+if __name__ == "__main__":
+  unittest.main()
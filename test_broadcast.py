@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from broadcast import Channel
+from game import Game, LEFT, HARD_DROP
+from protocol import LENGTH, PlayerView, unpack
+
+
+class Spectator:
+  """
+  Subscriber keeping the view of the game its messages describe.
+  """
+
+  def __init__(self):
+    self.view = PlayerView()
+
+  def write(self, message):
+    _, _, delta = unpack(message[LENGTH.size:])
+    self.view.apply(delta)
+
+
+class ChannelTest(unittest.TestCase):
+
+  def test_keyframe_after_garbage(self):
+    game = Game(seed=0)
+    channel = Channel()
+    early = Spectator()
+    channel.subscribe(early)
+    channel.publish(game.snapshot(), 1)
+    for tick, action in enumerate((LEFT, HARD_DROP, HARD_DROP), 2):
+      game.apply(action)
+      channel.publish(game.snapshot(), tick)
+    game.add_garbage(2, 3)
+    channel.publish(game.snapshot(), 5)
+    late = Spectator()
+    channel.subscribe(late)
+    np.testing.assert_array_equal(early.view.cells, game.board.cells)
+    np.testing.assert_array_equal(late.view.cells, early.view.cells)
+    self.assertEqual(late.view.current, early.view.current)
+
+
+if __name__ == "__main__":
+  unittest.main()
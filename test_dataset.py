@@ -0,0 +1,44 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from dataset import Dataset, DatasetWriter
+from game import Game, TopReached, HARD_DROP, HOLD
+from pieces import CELL_IDS
+
+
+class DatasetTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+      expected = []
+      for name in ("a", "b"):
+        game = Game(seed=len(expected))
+        with DatasetWriter(directory, name, chunk=16) as writer:
+          try:
+            for _ in range(100):
+              action = rng.choice((rng.randrange(HOLD + 1), HARD_DROP))
+              expected.append((game.board.cells != 0,
+                CELL_IDS[game.current_block.kind], action))
+              writer.append(game, action)
+          except TopReached:
+            pass
+      dataset = Dataset(directory)
+      self.assertEqual(len(dataset), len(expected))
+      records = dataset[:]
+      boards = dataset.boards(records)
+      for i, (board, current, action) in enumerate(expected):
+        np.testing.assert_array_equal(boards[i], board)
+        self.assertEqual(records[i]["current"], current)
+        self.assertEqual(records[i]["action"], action)
+      self.assertEqual(dataset[-1], records[-1])
+      # Only the records written are left in the files.
+      self.assertEqual(
+        sum(path.stat().st_size for path in Path(directory).glob("*.bin")),
+        len(expected) * records.dtype.itemsize)
+
+
+if __name__ == "__main__":
+  unittest.main()
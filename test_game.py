@@ -0,0 +1,28 @@
+import unittest
+from game import Game, RIGHT, HARD_DROP
+
+
+class RestoreTest(unittest.TestCase):
+
+  def test_drop_distance_after_restoring_a_sibling(self):
+    # Both lines of play lock one block and bring the same pooled
+    # piece back at the spawn, so only the board tells them apart.
+    game = Game(seed=0)
+    start = game.snapshot()
+    game.apply(HARD_DROP)
+    dropped = game.snapshot()
+    game.restore(start)
+    for _ in range(5):
+      game.apply(RIGHT)
+    game.apply(HARD_DROP)
+    game.drop_distance()
+    game.restore(dropped)
+    block = game.current_block
+    self.assertEqual(game.drop_distance(), game.board.drop_distance(
+      block.orientation.masks, block.orientation.bottoms, block.x, block.y))
+    game.apply(HARD_DROP)
+    self.assertEqual((game.board.cells != 0).sum(), 8)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import numpy as np
+from board import Board
+from bot import Bot
+from game import Game, TopReached, RIGHT, HARD_DROP
+from pieces import CELL_IDS
+from protocol import encode_delta, PlayerView
+
+
+def play(pieces, garbage_every, seed=0):
+  """
+  Play a game with the bot, pushing a garbage line every garbage_every
+  blocks, and return the states after each action and garbage push.
+  """
+  bot = Bot(beam_width=2, depth=1)
+  game = Game(seed=seed)
+  states = [game.snapshot()]
+  try:
+    while game.pieces_counter < pieces:
+      actions = bot.plan(game)
+      if not actions:
+        break
+      for action in actions:
+        game.apply(action)
+        states.append(game.snapshot())
+      if game.pieces_counter % garbage_every == 0:
+        game.add_garbage(1, game.pieces_counter % game.board.width)
+        states.append(game.snapshot())
+  except TopReached:
+    pass
+  return states
+
+
+class DeltaTest(unittest.TestCase):
+
+  def assert_round_trip(self, states):
+    view = PlayerView()
+    previous = None
+    for state in states:
+      view.apply(encode_delta(previous, state))
+      np.testing.assert_array_equal(view.cells, state.board[1])
+      self.assertEqual(view.current, state.current)
+      self.assertEqual(view.queue, state.queue)
+      self.assertEqual(view.hold, state.hold)
+      self.assertEqual(
+        (view.score, view.level, view.lines_counter),
+        (state.score, state.level, state.lines_counter))
+      previous = state
+
+  def test_line_clear_keeping_row_masks(self):
+    # The O block clears the two bottom rows, and the rows above land
+    # where rows of another kind had the same tiles.
+    cells = np.zeros((20, 10), dtype=np.int8)
+    cells[16:18, :8] = CELL_IDS["S"]
+    cells[18:, :8] = CELL_IDS["Z"]
+    game = Game(seed=0)
+    game.restore(game.snapshot()._replace(
+      board=Board.from_cells(cells).snapshot(), current=("O", 0, 4, 0)))
+    states = [game.snapshot()]
+    for action in (RIGHT,) * 5 + (HARD_DROP,):
+      game.apply(action)
+      states.append(game.snapshot())
+    self.assertEqual(len(game.cleared_rows), 2)
+    self.assert_round_trip(states)
+
+  def test_garbage(self):
+    self.assert_round_trip(play(60, garbage_every=3))
+
+  def test_unchanged_state(self):
+    state = Game(seed=0).snapshot()
+    self.assertEqual(encode_delta(state, state), bytes(1))
+
+
+if __name__ == "__main__":
+  unittest.main()
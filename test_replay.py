@@ -0,0 +1,49 @@
+import random
+import unittest
+import replay
+from game import Game, TopReached, HOLD
+
+
+def record(seed, actions=500):
+  """
+  Play random actions in a recorded game, with gravity every few of
+  them, and return the game.
+  """
+  rng = random.Random(seed)
+  game = Game(seed=seed, record=True)
+  try:
+    for _ in range(actions):
+      game.apply(rng.randrange(HOLD + 1))
+      for _ in range(rng.randrange(3)):
+        game.update_current_block()
+  except TopReached:
+    pass
+  return game
+
+
+class ReplayTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    game = record(0)
+    recorded = replay.from_game(game)
+    decoded = replay.decode(replay.encode(recorded))
+    self.assertEqual(decoded, recorded)
+    self.assertTrue(replay.verify(decoded))
+    self.assertEqual(replay.play(decoded).score, game.score)
+
+  def test_changed_input(self):
+    recorded = replay.from_game(record(1))
+    inputs = list(recorded.inputs)
+    tick, action = inputs[10]
+    inputs[10] = (tick, (action + 1) % (HOLD + 1))
+    self.assertFalse(replay.verify(recorded._replace(inputs=inputs)))
+
+  def test_not_a_replay(self):
+    data = replay.encode(replay.from_game(record(2, actions=20)))
+    for broken in (b"junk", data[:-1], data + b"\0"):
+      with self.assertRaises(replay.ReplayError):
+        replay.decode(broken)
+
+
+if __name__ == "__main__":
+  unittest.main()
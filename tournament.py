@@ -0,0 +1,214 @@
+"""
+Plays many seeded games with the bot in a pool of processes and
+reports statistics over them.
+
+Games are sent to the workers in shards of consecutive seeds, and
+the result of each game is written as a JSON line as soon as its
+shard is done. Only a few shards per worker are in flight at any
+time, so memory stays flat however many games are played.
+
+With --dataset, every action of the games is recorded in a dataset
+(see dataset.py), each worker writing a shard of its own.
+
+Usage: python tournament.py --games 1000 [--workers N] [--output FILE]
+"""
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.util import Finalize
+from bot import Bot, Weights, WEIGHTS
+from dataset import DatasetWriter
+from game import Game, TopReached, HOLD, LINES_PER_LEVEL
+from zobrist import TranspositionTable
+
+# Set in each worker by _init_worker.
+_bot = None
+_writer = None
+
+def _init_worker(weights, beam_width, depth, use_hold, table_size, policy,
+    dataset=None, run_id=None):
+  global _bot, _writer
+  _bot = Bot(weights, beam_width, depth, use_hold, table_size, policy)
+  if dataset:
+    _writer = DatasetWriter(dataset, "%s-worker-%d" % (run_id, os.getpid()))
+    # Workers aren't told they are done, but they run the finalizers of
+    # multiprocessing as they exit, which gives the unused records back.
+    Finalize(_writer, _writer.close, exitpriority=0)
+
+def play_game(bot, seed, max_pieces, writer=None):
+  """
+  Play a game until it's lost or max_pieces blocks are locked and
+  return its result. cause is how it ended: "top_out" when a new
+  block didn't fit or the bot had nowhere to place it,
+  "hold_top_out" when the held one didn't fit, or "max_pieces". table_hits and table_misses are the lookups in the
+  transposition table of the bot during the game. With writer, a
+  DatasetWriter, every action is recorded.
+  """
+  table = bot.table
+  hits, misses = (table.hits, table.misses) if table else (0, 0)
+  game = Game(seed=seed)
+  cause = "max_pieces"
+  action = None
+  try:
+    while game.pieces_counter < max_pieces:
+      actions = bot.plan(game)
+      if not actions:
+        cause = "top_out"
+        break
+      for action in actions:
+        if writer:
+          writer.append(game, action)
+        else:
+          game.apply(action)
+  except TopReached:
+    cause = "hold_top_out" if action == HOLD else "top_out"
+  return {
+    "seed": seed,
+    "score": game.score,
+    "lines": (game.level - 1) * LINES_PER_LEVEL + game.lines_counter,
+    "level": game.level,
+    "pieces": game.pieces_counter,
+    "cause": cause,
+    "table_hits": table.hits - hits if table else 0,
+    "table_misses": table.misses - misses if table else 0,
+  }
+
+def _play_shard(seeds, max_pieces):
+  results = [play_game(_bot, seed, max_pieces, _writer) for seed in seeds]
+  if _writer:
+    # Made visible shard by shard, not only once the worker exits.
+    _writer.flush()
+  return results
+
+def run(games, workers=None, first_seed=0, shard_size=4, max_pieces=1000,
+    bot_args=(WEIGHTS, 8, 3, True, 1 << 16, "depth"), dataset=None):
+  """
+  Play games games with seeds from first_seed on and yield their
+  results as they come, in no particular order. With dataset, a
+  directory, their actions are recorded there.
+  """
+  workers = workers or os.cpu_count()
+  # Tells the shards of the run apart from those of earlier runs in the
+  # same dataset.
+  run_id = "%s-%s" % (time.strftime("%Y%m%d-%H%M%S"), secrets.token_hex(4))
+  shards = (range(seed, min(seed + shard_size, first_seed + games))
+    for seed in range(first_seed, first_seed + games, shard_size))
+  with ProcessPoolExecutor(workers, initializer=_init_worker,
+      initargs=bot_args + (dataset, run_id)) as executor:
+    pending = set()
+    for shard in shards:
+      pending.add(executor.submit(_play_shard, shard, max_pieces))
+      if len(pending) >= 2 * workers:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          yield from future.result()
+    for future in pending:
+      yield from future.result()
+
+class Stats:
+  """
+  Aggregates the results of the games. Only the scores are kept one
+  by one, in a compact array, for their distribution.
+  """
+
+  def __init__(self):
+    self.scores = array("q")
+    self.pieces = 0
+    self.lines = 0
+    self.level_max = 0
+    self.causes = Counter()
+    self.table_hits = 0
+    self.table_misses = 0
+
+  def add(self, result):
+    self.scores.append(result["score"])
+    self.pieces += result["pieces"]
+    self.lines += result["lines"]
+    self.level_max = max(self.level_max, result["level"])
+    self.causes[result["cause"]] += 1
+    self.table_hits += result["table_hits"]
+    self.table_misses += result["table_misses"]
+
+  def summary(self, elapsed):
+    games = len(self.scores)
+    scores = sorted(self.scores)
+    # Inclusive, so the deciles stay within the scores seen.
+    deciles = (statistics.quantiles(scores, n=10, method="inclusive")
+      if games > 1 else scores)
+    lookups = self.table_hits + self.table_misses
+    return {
+      "games": games,
+      "seconds": round(elapsed, 3),
+      "games_per_second": round(games / elapsed, 2),
+      "pieces_per_second": round(self.pieces / elapsed, 1),
+      "score_mean": statistics.fmean(scores),
+      "score_stdev": statistics.pstdev(scores),
+      "score_min": scores[0],
+      "score_deciles": deciles,
+      "score_max": scores[-1],
+      "lines_mean": self.lines / games,
+      "level_max": self.level_max,
+      "causes": dict(self.causes),
+      "table_hits": self.table_hits,
+      "table_misses": self.table_misses,
+      "table_hit_rate": round(self.table_hits / lookups, 4) if lookups else 0,
+    }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Play seeded games with the bot and report statistics.")
+  parser.add_argument("--games", type=int, default=100)
+  parser.add_argument("--seed", type=int, default=0,
+    help="seed of the first game, the next ones count up from it")
+  parser.add_argument("--workers", type=int,
+    help="worker processes (default: one per core)")
+  parser.add_argument("--shard-size", type=int, default=4,
+    help="games sent to a worker at once (default: 4)")
+  parser.add_argument("--max-pieces", type=int, default=1000,
+    help="blocks after which a game is stopped (default: 1000)")
+  parser.add_argument("--beam-width", type=int, default=8)
+  parser.add_argument("--depth", type=int, default=3)
+  parser.add_argument("--no-hold", action="store_true")
+  parser.add_argument("--table-size", type=int, default=1 << 16,
+    help="entries of the transposition table of the bot, a power of two, "
+      "0 for none (default: 65536)")
+  parser.add_argument("--table-policy", choices=TranspositionTable.POLICIES,
+    default="depth", help="replacement policy of the transposition table "
+      "(default: depth)")
+  parser.add_argument("--weights", type=float, nargs=4, default=WEIGHTS,
+    metavar=Weights._fields, help="feature weights of the bot")
+  parser.add_argument("--dataset", metavar="DIR",
+    help="record every action of the games in the dataset DIR")
+  parser.add_argument("--output", metavar="FILE",
+    help="write the result of each game to FILE as JSON lines")
+  args = parser.parse_args(argv)
+
+  bot_args = (Weights(*args.weights), args.beam_width, args.depth,
+    not args.no_hold, args.table_size, args.table_policy)
+  output = open(args.output, "w") if args.output else None
+  stats = Stats()
+  start = time.perf_counter()
+  try:
+    for result in run(args.games, args.workers, args.seed, args.shard_size,
+        args.max_pieces, bot_args, args.dataset):
+      stats.add(result)
+      if output:
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+  finally:
+    if output:
+      output.close()
+  elapsed = time.perf_counter() - start
+  if stats.scores:
+    print(json.dumps(stats.summary(elapsed), indent=2))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
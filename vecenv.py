@@ -0,0 +1,295 @@
+import numpy as np
+from game import (LEFT, RIGHT, SOFT_DROP, HARD_DROP, ROTATE_LEFT,
+  ROTATE_RIGHT, HOLD, LINE_SCORES, PERFECT_CLEAR_SCORES, COMBO_SCORE,
+  LINES_PER_LEVEL, SPAWN_Y, spawn_x)
+from pieces import KINDS, CELL_IDS, ORIENTATIONS, ROTATIONS
+
+# Tiles of each kind and orientation as (dy, dx) offsets, shaped
+# (kind, rotation, tile, 2).
+TILES = np.array([
+  [np.argwhere(ORIENTATIONS[kind][r].struct) for r in range(4)]
+  for kind in KINDS
+])
+
+def _rotation_tables():
+  # The kick lists differ in length, so the shorter ones are padded
+  # repeating their last test.
+  tests = max(len(ROTATIONS[kind][0][1][1]) for kind in KINDS)
+  new_rotation = np.zeros((len(KINDS), 4, 2), dtype=np.int8)
+  kicks = np.zeros((len(KINDS), 4, 2, tests, 2), dtype=np.int8)
+  for k, kind in enumerate(KINDS):
+    for r in range(4):
+      for d, direction in enumerate((-1, 1)):
+        rotation, offsets = ROTATIONS[kind][r][direction]
+        offsets = offsets + offsets[-1:] * (tests - len(offsets))
+        new_rotation[k, r, d] = rotation
+        kicks[k, r, d] = offsets
+  return new_rotation, kicks
+
+# New orientation and kick tests (dx, dy) of each kind and
+# orientation, rotating left (0) or right (1).
+NEW_ROTATION, KICKS = _rotation_tables()
+
+CELLS = np.array([CELL_IDS[kind] for kind in KINDS], dtype=np.int8)
+O_KIND = KINDS.index("O")
+NO_HOLD = -1
+
+
+class VecEnv:
+  """
+  num_games games stepped in lockstep. Each game state is a row of
+  a NumPy array, so every step applies one action per game with
+  vectorized operations over the whole batch: the boards are held in
+  a single (num_games, height, width) array of cell ids.
+
+  Actions are the ones of game.py: LEFT, RIGHT, SOFT_DROP, HARD_DROP,
+  ROTATE_LEFT, ROTATE_RIGHT and HOLD; any other value does nothing.
+  The current blocks fall one row every gravity steps. Finished
+  games are reset right away, their done flag being set for that
+  step.
+  """
+
+  def __init__(self, num_games, width=10, height=20, gravity=10, seed=None):
+    self.num_games = num_games
+    self.width = width
+    self.height = height
+    self.gravity = gravity
+    self.rng = np.random.default_rng(seed)
+    self.boards = np.zeros((num_games, height, width), dtype=np.int8)
+    self.kind = np.zeros(num_games, dtype=np.int8)
+    self.rotation = np.zeros(num_games, dtype=np.int8)
+    self.x = np.zeros(num_games, dtype=np.int32)
+    self.y = np.zeros(num_games, dtype=np.int32)
+    self.queue = np.zeros((num_games, 3), dtype=np.int8)
+    self.hold = np.zeros(num_games, dtype=np.int8)
+    self.hold_blocked = np.zeros(num_games, dtype=bool)
+    self.bag = np.zeros((num_games, len(KINDS)), dtype=np.int8)
+    self.bag_index = np.zeros(num_games, dtype=np.int32)
+    self.score = np.zeros(num_games, dtype=np.int64)
+    self.level = np.zeros(num_games, dtype=np.int32)
+    self.lines_counter = np.zeros(num_games, dtype=np.int32)
+    self.combo_counter = np.zeros(num_games, dtype=np.int32)
+    self.ticks = np.zeros(num_games, dtype=np.int32)
+    self.rewards = np.zeros(num_games, dtype=np.int64)
+    self.dones = np.zeros(num_games, dtype=bool)
+    self.reset()
+
+  def observe(self):
+    """
+    Return the observation arrays. They are the state arrays
+    themselves, not copies, so they are only valid until the next
+    step.
+    """
+    return {
+      "board": self.boards,
+      "kind": self.kind,
+      "rotation": self.rotation,
+      "x": self.x,
+      "y": self.y,
+      "queue": self.queue,
+      "hold": self.hold,
+    }
+
+  def reset(self, games=None):
+    """
+    Start new games, for all of them or for the given indexes.
+    """
+    if games is None:
+      games = np.arange(self.num_games)
+    self.boards[games] = 0
+    self.hold[games] = NO_HOLD
+    self.score[games] = 0
+    self.level[games] = 1
+    self.lines_counter[games] = 0
+    self.combo_counter[games] = 0
+    self.bag_index[games] = len(KINDS)
+    for i in range(self.queue.shape[1]):
+      self.queue[games, i] = self._next_kind(games)
+    self._spawn(games, self._pop_queue(games))
+    return self.observe()
+
+  def _next_kind(self, games):
+    """
+    Draw the next kind from each game's 7-bag, refilling the empty
+    bags with fresh permutations.
+    """
+    empty = games[self.bag_index[games] >= len(KINDS)]
+    if empty.size:
+      self.bag[empty] = self.rng.permuted(
+        np.tile(np.arange(len(KINDS), dtype=np.int8), (empty.size, 1)),
+        axis=1)
+      self.bag_index[empty] = 0
+    kinds = self.bag[games, self.bag_index[games]]
+    self.bag_index[games] += 1
+    return kinds
+
+  def _pop_queue(self, games):
+    kinds = self.queue[games, 0]
+    self.queue[games, :-1] = self.queue[games, 1:]
+    self.queue[games, -1] = self._next_kind(games)
+    return kinds
+
+  def _collides(self, games, rotation, x, y):
+    """
+    Check, for each of the given games, if its current block would
+    go out of the board or overlap a locked tile with the given
+    orientation and position. Rows above the board are empty.
+    """
+    tiles = TILES[self.kind[games], rotation]
+    ys = y[:, None] + tiles[..., 0]
+    xs = x[:, None] + tiles[..., 1]
+    outside = (xs < 0) | (xs >= self.width) | (ys >= self.height)
+    inside = ~outside & (ys >= 0)
+    taken = self.boards[
+      games[:, None],
+      np.clip(ys, 0, self.height - 1),
+      np.clip(xs, 0, self.width - 1)] != 0
+    return (outside | (inside & taken)).any(axis=1)
+
+  def _spawn(self, games, kinds):
+    """
+    Make kinds the current blocks of the given games. The games
+    where they don't fit are over.
+    """
+    self.kind[games] = kinds
+    self.rotation[games] = 0
+    self.x[games] = spawn_x(self.width)
+    self.y[games] = SPAWN_Y
+    self.ticks[games] = 0
+    self.hold_blocked[games] = False
+    self.dones[games] = self._collides(
+      games, self.rotation[games], self.x[games], self.y[games])
+
+  def _shift(self, games, dx, dy):
+    """
+    Move the current blocks of the given games if they fit. Return
+    which ones didn't.
+    """
+    x = self.x[games] + dx
+    y = self.y[games] + dy
+    blocked = self._collides(games, self.rotation[games], x, y)
+    moved = games[~blocked]
+    self.x[moved] = x[~blocked]
+    self.y[moved] = y[~blocked]
+    return blocked
+
+  def _rotate(self, games, direction):
+    games = games[self.kind[games] != O_KIND]
+    kinds = self.kind[games]
+    rotation = NEW_ROTATION[kinds, self.rotation[games], direction]
+    kicks = KICKS[kinds, self.rotation[games], direction]
+    for test in range(KICKS.shape[3]):
+      x = self.x[games] + kicks[:, test, 0]
+      y = self.y[games] + kicks[:, test, 1]
+      fits = ~self._collides(games, rotation, x, y)
+      rotated = games[fits]
+      self.rotation[rotated] = rotation[fits]
+      self.x[rotated] = x[fits]
+      self.y[rotated] = y[fits]
+      games, rotation, kicks = games[~fits], rotation[~fits], kicks[~fits]
+
+  def _drop_distance(self, games):
+    distance = np.zeros(games.size, dtype=np.int32)
+    falling = np.arange(games.size)
+    while falling.size:
+      g = games[falling]
+      blocked = self._collides(g, self.rotation[g], self.x[g],
+        self.y[g] + distance[falling] + 1)
+      falling = falling[~blocked]
+      distance[falling] += 1
+    return distance
+
+  def _hold(self, games):
+    games = games[~self.hold_blocked[games]]
+    held = self.hold[games]
+    self.hold[games] = self.kind[games]
+    empty = held == NO_HOLD
+    held[empty] = self._pop_queue(games[empty])
+    self._spawn(games, held)
+    self.hold_blocked[games] = True
+
+  def _lock(self, games):
+    """
+    Lock the current blocks of the given games, clear the complete
+    lines, score them and spawn the next blocks.
+    """
+    tiles = TILES[self.kind[games], self.rotation[games]]
+    ys = self.y[games, None] + tiles[..., 0]
+    xs = self.x[games, None] + tiles[..., 1]
+    visible = ys >= 0
+    g = np.broadcast_to(games[:, None], ys.shape)
+    self.boards[g[visible], ys[visible], xs[visible]] = \
+      CELLS[self.kind[g[visible]]]
+
+    boards = self.boards[games]
+    full = boards.all(axis=2)
+    lines = full.sum(axis=1)
+    cleared = lines > 0
+    if cleared.any():
+      # Each kept row falls as many rows as there are full rows
+      # below it.
+      below = full[:, ::-1].cumsum(axis=1)[:, ::-1] - full
+      board, row = np.nonzero(~full)
+      compacted = np.zeros_like(boards)
+      compacted[board, row + below[board, row]] = boards[board, row]
+      self.boards[games] = compacted
+
+    level = self.level[games]
+    perfect = ~self.boards[games, -1].any(axis=1)
+    points = np.where(perfect,
+      np.take(PERFECT_CLEAR_SCORES, lines),
+      np.take(LINE_SCORES, lines)) * level
+    combo = self.combo_counter[games]
+    points += np.where(cleared & (combo > 0), COMBO_SCORE * combo * level, 0)
+    self.score[games] += points
+    self.combo_counter[games] = np.where(cleared, combo + 1, 0)
+    lines_counter = self.lines_counter[games] + lines
+    level_up = lines_counter >= LINES_PER_LEVEL
+    self.level[games] += level_up
+    self.lines_counter[games] = lines_counter - level_up * LINES_PER_LEVEL
+
+    self._spawn(games, self._pop_queue(games))
+
+  def step(self, actions):
+    """
+    Apply one action per game. Return (observation, rewards, dones),
+    rewards being the score gained in the step.
+    """
+    actions = np.asarray(actions)
+    self.rewards[:] = -self.score
+    self.dones[:] = False
+    everyone = np.arange(self.num_games)
+    locking = np.zeros(self.num_games, dtype=bool)
+
+    self._shift(everyone[actions == LEFT], -1, 0)
+    self._shift(everyone[actions == RIGHT], 1, 0)
+    self._rotate(everyone[actions == ROTATE_LEFT], 0)
+    self._rotate(everyone[actions == ROTATE_RIGHT], 1)
+    self._hold(everyone[actions == HOLD])
+
+    games = everyone[actions == SOFT_DROP]
+    blocked = self._shift(games, 0, 1)
+    self.score[games[~blocked]] += 1
+    locking[games[blocked]] = True
+
+    games = everyone[actions == HARD_DROP]
+    distance = self._drop_distance(games)
+    self.y[games] += distance
+    self.score[games] += 2 * distance
+    locking[games] = True
+
+    # Gravity.
+    self.ticks += 1
+    games = everyone[~locking & ~self.dones & (self.ticks >= self.gravity)]
+    self.ticks[games] = 0
+    locking[games[self._shift(games, 0, 1)]] = True
+
+    self._lock(everyone[locking & ~self.dones])
+    self.rewards += self.score
+
+    over = np.flatnonzero(self.dones)
+    if over.size:
+      dones = self.dones.copy()
+      self.reset(over)
+      self.dones[:] = dones
+    return self.observe(), self.rewards, self.dones
@@ -0,0 +1,163 @@
+"""
+Zobrist hashing of search states, and a bounded transposition table.
+
+Every tile of the board, every kind at each position of the queue and
+every held kind gets a random 64 bits key, and the key of a state is
+the XOR of the keys of its parts. Adding tiles only XORs their keys
+in, so the key of a board is kept up to date as blocks lock instead
+of being computed again, and only the rows moved by a line clear are
+hashed again.
+"""
+import random
+from functools import lru_cache
+from pieces import KINDS
+
+# Queue positions with keys of their own, more than a search looks at.
+QUEUE_LENGTH = 8
+
+def _byte_table(keys):
+  # XOR of the keys of the bits set, for every byte value.
+  keys = keys + [0] * (8 - len(keys))
+  table = [0] * 256
+  for value in range(1, 256):
+    low = value & -value
+    table[value] = table[value ^ low] ^ keys[low.bit_length() - 1]
+  return table
+
+
+class Zobrist:
+  """
+  Keys of a width x height board. The tile keys of a row are combined
+  by byte, so a row bitmask is hashed with one lookup per 8 columns.
+  """
+
+  @staticmethod
+  @lru_cache(maxsize=None)
+  def for_board(width, height):
+    """
+    Return the keys of a board size, built once per size.
+    """
+    return Zobrist(width, height)
+
+  def __init__(self, width, height, seed=0):
+    rng = random.Random(seed)
+    self.rows = []
+    for y in range(height):
+      tiles = [rng.getrandbits(64) for x in range(width)]
+      self.rows.append([_byte_table(tiles[i:i + 8])
+        for i in range(0, width, 8)])
+    self.queue = [{kind: rng.getrandbits(64) for kind in KINDS}
+      for _ in range(QUEUE_LENGTH)]
+    self.hold = {kind: rng.getrandbits(64) for kind in KINDS}
+    self.hold[None] = 0
+    # Keys of the tiles of blocks, by (row masks, x, y).
+    self._pieces = {}
+
+  def row_key(self, y, row):
+    """
+    Return the key of the tiles of a row bitmask placed at row y.
+    """
+    key = 0
+    for table in self.rows[y]:
+      if not row:
+        break
+      key ^= table[row & 255]
+      row >>= 8
+    return key
+
+  def piece_key(self, masks, x, y):
+    """
+    Return the key of the tiles of a block with the given row masks
+    placed at (x, y), rows above the board being dropped.
+    """
+    spot = (masks, x, y)
+    key = self._pieces.get(spot)
+    if key is None:
+      key = 0
+      for i, mask in enumerate(masks):
+        if y + i >= 0:
+          key ^= self.row_key(y + i, mask << x)
+      self._pieces[spot] = key
+    return key
+
+  def board_key(self, rows, stop=None):
+    """
+    Return the key of a board given by its rows, or by its rows above
+    stop.
+    """
+    key = 0
+    for y, row in enumerate(rows[:stop]):
+      if row:
+        key ^= self.row_key(y, row)
+    return key
+
+  def state_key(self, board_key, queue, hold):
+    """
+    Return the key of a search state: a board key, the kinds left to
+    place, the first being the active block, and the held kind.
+    """
+    key = board_key ^ self.hold[hold]
+    for keys, kind in zip(self.queue, queue):
+      key ^= keys[kind]
+    return key
+
+
+class TranspositionTable:
+  """
+  Values stored by key in a fixed number of slots, size being a power
+  of two. A key goes to the slot of its low bits; when another key
+  holds it, policy picks the entry kept:
+
+    always  the new one
+    depth   the one stored with the larger depth, the new one on ties
+
+  hits and misses count the lookups, stores the entries written and
+  replaced the ones overwritten by another key.
+  """
+
+  POLICIES = ("always", "depth")
+
+  def __init__(self, size=1 << 16, policy="depth"):
+    if size <= 0 or size & (size - 1):
+      raise ValueError("size must be a power of two")
+    if policy not in self.POLICIES:
+      raise ValueError("unknown replacement policy %r" % policy)
+    self.policy = policy
+    self._mask = size - 1
+    self.clear()
+
+  def clear(self):
+    self._slots = [None] * (self._mask + 1)
+    self.hits = self.misses = self.stores = self.replaced = 0
+
+  def get(self, key):
+    """
+    Return the value stored for key, or None.
+    """
+    entry = self._slots[key & self._mask]
+    if entry is not None and entry[0] == key:
+      self.hits += 1
+      return entry[2]
+    self.misses += 1
+    return None
+
+  def put(self, key, value, depth=0):
+    slot = key & self._mask
+    entry = self._slots[slot]
+    if entry is not None and entry[0] != key:
+      if self.policy == "depth" and entry[1] > depth:
+        return
+      self.replaced += 1
+    self._slots[slot] = (key, depth, value)
+    self.stores += 1
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+      "stores": self.stores,
+      "replaced": self.replaced,
+      "size": self._mask + 1,
+    }